@@ -1,8 +1,39 @@
 # SPDX-License-Identifier: Apache-2.0
 #!/usr/bin/env python3
-import argparse, json, os, subprocess, sys, shutil, glob, pathlib
+import argparse, importlib.util, json, os, subprocess, sys, shutil, glob, pathlib, socket, socketserver
 
 REPORTS_DIR = "reports"
+SOCKET_PATH = os.environ.get("AI_CLI_SOCKET", ".ai/ai_cli.sock")
+# Files whose change invalidates the daemon's cached stack detection and installs
+MANIFESTS = ["package.json", "package-lock.json", "pyproject.toml", "requirements.txt"]
+# Client env vars that select the interpreter/toolchain; a change resets the daemon's caches
+# and makes pytest run cold, since the warm pytest import belongs to the daemon's interpreter
+TOOLCHAIN_ENV = ["PATH", "VIRTUAL_ENV", "CONDA_PREFIX", "PYTHONPATH", "PYTHONHOME", "NODE_PATH"]
+
+_sink = None          # set by `serve` to stream command output to the connected client
+_setup_done = set()   # setup (install) commands already run by this process
+_stacks_cache = None
+_pytest = None        # pytest module preloaded by `serve` for warm test runs
+_pytest_env = None    # TOOLCHAIN_ENV values the daemon (and its pytest import) started with
+
+def load_telemetry():
+    """scripts/telemetry.py under a private module name. sys.path and sys.modules["telemetry"]
+    stay untouched, so a project's own `telemetry` module still wins in warm pytest runs."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "telemetry.py")
+    if not os.path.exists(path): return None  # ai_cli.py copied without scripts/: no event log
+    spec = importlib.util.spec_from_file_location("_ai_cli_telemetry", path)
+    mod = importlib.util.module_from_spec(spec); spec.loader.exec_module(mod)
+    return mod
+
+telemetry = load_telemetry()
+
+def say(msg):
+    """Message for the user: streamed to the client under `serve`, else stderr."""
+    if _sink is not None: _sink(msg + "\n")
+    else: print(msg, file=sys.stderr)
+
+def toolchain_env():
+    return tuple(os.environ.get(k) for k in TOOLCHAIN_ENV)
 
 def ensure_reports():
     os.makedirs(REPORTS_DIR, exist_ok=True)
@@ -11,6 +42,8 @@ def which(cmd):
     return shutil.which(cmd) is not None
 
 def detect_stacks():
+    if _stacks_cache is not None:
+        return _stacks_cache
     stacks = []
     cwd = pathlib.Path(".")
     if (cwd/"package.json").exists():
@@ -20,15 +53,56 @@ def detect_stacks():
     return stacks
 
 def run_cmd(cmd, env=None):
-    print(f"+ {cmd}", flush=True)
-    result = subprocess.run(cmd, shell=True, env=env)
-    return result.returncode
+    if _sink is None:
+        print(f"+ {cmd}", flush=True)
+        result = subprocess.run(cmd, shell=True, env=env)
+        return result.returncode
+    _sink(f"+ {cmd}\n")
+    proc = subprocess.Popen(cmd, shell=True, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    for line in proc.stdout:
+        _sink(line.decode("utf-8", errors="replace"))
+    return proc.wait()
+
+def run_setup(cmd):
+    """Run a dependency install once; the daemon skips it until a manifest changes.
+
+    Only a successful install is cached, so a failed one is retried on the next run.
+    Failures are reported but never fatal (always returns 0, like `cmd || true`).
+    """
+    if telemetry: telemetry.emit("cache", stage="ai_cli.setup", hit=cmd in _setup_done, cmd=cmd)
+    if cmd in _setup_done:
+        if _sink is not None: _sink(f"= {cmd} (cached)\n")
+        return 0
+    rc = run_cmd(cmd)
+    if rc == 0: _setup_done.add(cmd)
+    else: say(f"setup failed (rc={rc}), continuing: {cmd}")
+    return 0
+
+def run_pytest(args):
+    """Run pytest in a child forked from the daemon, so the pytest import is already warm."""
+    if _pytest is None or _sink is None or toolchain_env() != _pytest_env:
+        return run_cmd("pytest " + " ".join(args) + " || true")
+    _sink(f"+ pytest {' '.join(args)} (warm)\n")
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r); os.dup2(w, 1); os.dup2(w, 2)
+        try: rc = int(_pytest.main(list(args)))
+        except BaseException: rc = 1
+        sys.stdout.flush(); sys.stderr.flush()
+        os._exit(rc)
+    os.close(w)
+    with os.fdopen(r, "rb") as out:
+        for line in out:
+            _sink(line.decode("utf-8", errors="replace"))
+    os.waitpid(pid, 0)
+    return 0  # same as the cold `pytest ... || true`
 
 # Node adapter
 def node_build(): return run_cmd("npm run build || npx -y typescript -p .")
 def node_test():
     ensure_reports()
-    run_cmd("npm i -D jest jest-junit --no-audit --no-fund || true")
+    run_setup("npm i -D jest jest-junit --no-audit --no-fund")
     return run_cmd("npm test -- --reporters=default --reporters=jest-junit || npx -y jest --reporters=default --reporters=jest-junit")
 def node_lint(): return run_cmd("npm run lint || npx -y eslint . || true")
 def node_format(): return run_cmd("npm run format || npx -y prettier -w . || true")
@@ -46,20 +120,20 @@ def py_build():
     return 0
 def py_test():
     ensure_reports()
-    run_cmd("python3 -m pip install -q pytest pytest-junitxml || true")
-    return run_cmd("pytest -q --junitxml=reports/junit.xml || true")
+    run_setup("python3 -m pip install -q pytest")  # --junitxml is built into pytest
+    return run_pytest(["-q", "--junitxml=reports/junit.xml"])
 def py_lint():
-    run_cmd("python3 -m pip install -q ruff || true")
+    run_setup("python3 -m pip install -q ruff")
     return run_cmd("ruff check . || true")
 def py_format():
-    run_cmd("python3 -m pip install -q ruff || true")
+    run_setup("python3 -m pip install -q ruff")
     return run_cmd("ruff format . || true")
 def py_coverage():
-    run_cmd("python3 -m pip install -q coverage pytest || true")
+    run_setup("python3 -m pip install -q coverage pytest")
     ensure_reports()
     return run_cmd("coverage run -m pytest && coverage xml -o reports/coverage.xml || true")
 def py_mutation():
-    run_cmd("python3 -m pip install -q mutmut || true")
+    run_setup("python3 -m pip install -q mutmut")
     return run_cmd("mutmut run || true")
 
 def apply_patch(patch_path):
@@ -73,25 +147,122 @@ def reports_upload():
     print(json.dumps({"reports": files}, indent=2))
     return 0
 
+def run_task(task):
+    stacks = detect_stacks(); stack = stacks[0]["stack"] if stacks else None
+    if not stack: say("No stack detected"); return 2
+    if stack == "node": fn = {"build": node_build, "test": node_test, "lint": node_lint, "format": node_format, "coverage": node_coverage, "mutation": node_mutation}[task]
+    elif stack == "python": fn = {"build": py_build, "test": py_test, "lint": py_lint, "format": py_format, "coverage": py_coverage, "mutation": py_mutation}[task]
+    else: say(f"Unsupported stack: {stack}"); return 3
+    if telemetry is None: return fn()
+    with telemetry.span(f"ai_cli.{task}", stack=stack, daemon=_sink is not None) as ev:
+        rc = fn(); ev["rc"] = rc; ev["ok"] = rc == 0
+    return rc
+
+# Daemon: `serve` keeps stack detection, installs and the pytest import warm;
+# `run` forwards to it over a Unix socket when one is listening.
+def manifest_stamp():
+    stamp = []
+    for name in MANIFESTS:
+        try: st = os.stat(name); stamp.append((name, st.st_mtime_ns, st.st_size))
+        except OSError: stamp.append((name, None, None))
+    return tuple(stamp)
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def send(self, msg):
+        try: self.wfile.write((json.dumps(msg) + "\n").encode("utf-8")); self.wfile.flush()
+        except OSError: pass  # client went away; keep running so caches stay consistent
+
+    def handle(self):
+        global _sink, _stacks_cache
+        try: req = json.loads(self.rfile.readline() or b"{}")
+        except ValueError: self.send({"error": "bad request"}); return
+        cmd = req.get("cmd")
+        if cmd == "ping": self.send({"rc": 0}); return
+        if cmd == "shutdown":
+            self.send({"rc": 0}); self.server.stopping = True; return
+        if cmd != "run" or req.get("task") not in TASKS:
+            self.send({"error": f"unsupported request: {req}"}); return
+        # run in the client's cwd and environment, as `run --local` would
+        saved_env, saved_cwd = dict(os.environ), os.getcwd()
+        try:
+            if req.get("env") is not None: os.environ.clear(); os.environ.update(req["env"])
+            if req.get("cwd"): os.chdir(req["cwd"])
+            stamp = (os.getcwd(), manifest_stamp(), toolchain_env())
+            if stamp != self.server.stamp:
+                _setup_done.clear(); _stacks_cache = None; self.server.stamp = stamp
+            if _stacks_cache is None: _stacks_cache = detect_stacks()
+            _sink = lambda text: self.send({"out": text})
+            rc = run_task(req["task"])
+        except Exception as e: self.send({"out": f"daemon error: {e}\n"}); rc = 1
+        finally:
+            _sink = None
+            if telemetry: telemetry.flush()  # LOG_DIR is relative: write into the client's project
+            os.environ.clear(); os.environ.update(saved_env); os.chdir(saved_cwd)
+        self.send({"rc": rc})
+
+def serve(sock_path):
+    global _pytest, _pytest_env
+    try: import pytest as _pytest  # noqa: F811 - preload once; forked test runs reuse it
+    except ImportError: _pytest = None
+    _pytest_env = toolchain_env()
+    os.makedirs(os.path.dirname(sock_path) or ".", exist_ok=True)
+    if os.path.exists(sock_path): os.unlink(sock_path)
+    server = socketserver.UnixStreamServer(sock_path, DaemonHandler)
+    server.stamp = None; server.stopping = False
+    os.chmod(sock_path, 0o600)
+    print(f"ai_cli daemon listening on {sock_path} (pytest {'warm' if _pytest else 'unavailable'})", flush=True)
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close(); os.unlink(sock_path)
+    return 0
+
+def client_request(sock_path, req):
+    """Send a request to the daemon and stream its output; None if no daemon is listening."""
+    if not os.path.exists(sock_path): return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try: s.connect(sock_path)
+    except OSError: s.close(); return None
+    with s, s.makefile("rwb") as f:
+        f.write((json.dumps(req) + "\n").encode("utf-8")); f.flush()
+        for line in f:
+            msg = json.loads(line)
+            if "out" in msg: sys.stdout.write(msg["out"]); sys.stdout.flush()
+            elif "error" in msg: print(msg["error"], file=sys.stderr); return 2
+            elif "rc" in msg: return msg["rc"]
+    print("daemon closed the connection", file=sys.stderr); return 1
+
+TASKS = ["build","test","lint","format","coverage","mutation"]
+
 def main():
     parser = argparse.ArgumentParser(description="AI CLI (stack-agnostic)")
     sub = parser.add_subparsers(dest="cmd")
     sub.add_parser("detect")
-    run_p = sub.add_parser("run"); run_p.add_argument("--task", required=True, choices=["build","test","lint","format","coverage","mutation"])
+    run_p = sub.add_parser("run"); run_p.add_argument("--task", required=True, choices=TASKS)
+    run_p.add_argument("--local", action="store_true", help="run in this process even if a daemon is listening")
+    run_p.add_argument("--socket", default=SOCKET_PATH)
     ap = sub.add_parser("apply-patch"); ap.add_argument("--file", required=True)
     sub.add_parser("reports")
+    sv = sub.add_parser("serve", help="long-lived daemon with warm caches for `run`")
+    sv.add_argument("--socket", default=SOCKET_PATH); sv.add_argument("--stop", action="store_true")
     args = parser.parse_args()
 
     if args.cmd == "detect":
         print(json.dumps({"stacks": detect_stacks()}, indent=2)); return 0
 
-    stacks = detect_stacks(); stack = stacks[0]["stack"] if stacks else None
     if args.cmd == "run":
-        if not stack: print("No stack detected", file=sys.stderr); return 2
-        if stack == "node": fn = {"build": node_build, "test": node_test, "lint": node_lint, "format": node_format, "coverage": node_coverage, "mutation": node_mutation}[args.task]
-        elif stack == "python": fn = {"build": py_build, "test": py_test, "lint": py_lint, "format": py_format, "coverage": py_coverage, "mutation": py_mutation}[args.task]
-        else: print(f"Unsupported stack: {stack}", file=sys.stderr); return 3
-        return fn()
+        rc = None if args.local else client_request(args.socket, {"cmd": "run", "task": args.task,
+                                                                      "cwd": os.getcwd(), "env": dict(os.environ)})
+        return run_task(args.task) if rc is None else rc
+    if args.cmd == "serve":
+        if args.stop:
+            rc = client_request(args.socket, {"cmd": "shutdown"})
+            if rc is None: print("no daemon listening", file=sys.stderr); return 1
+            return rc
+        return serve(args.socket)
     if args.cmd == "apply-patch": return apply_patch(args.file)
     if args.cmd == "reports": return reports_upload()
     parser.print_help(); return 0
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Synthetic-corpus benchmark for the ingestion and retrieval pipeline.
+
+Generates a deterministic synthetic repo (file count, languages, file-size
+distribution and duplicate rate are configurable) with a matching query/gold
+set, runs ingest_to_opensearch.ingest() and eval_rag.evaluate_rag() against
+an in-memory BM25 stand-in for OpenSearch (no network), and writes a JSON
+report that can be diffed across commits.
+
+Usage:
+  python scripts/bench_pipeline.py --files 2000 --out reports/bench.json
+  python scripts/bench_pipeline.py --compare reports/bench-main.json --out reports/bench.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCHEMA_VERSION = 1
+LANGS = {
+    "py": "def {a}({b}):\n    return {c} + {b}  # {w}\n",
+    "js": "function {a}({b}) {{ return {c} + {b}; }} // {w}\n",
+    "ts": "export const {a} = ({b}: number): number => {c} + {b}; // {w}\n",
+    "go": "func {a}({b} int) int {{ return {c} + {b} }} // {w}\n",
+    "java": "static int {a}(int {b}) {{ return {c} + {b}; }} // {w}\n",
+}
+VOCAB = ("value index count total buffer handler request response config cache token parse "
+         "render update delete create fetch load store merge split filter reduce queue retry").split()
+
+
+def rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024), 1)
+
+
+def percentiles(values: List[float], pcts=(50, 95, 99)) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in pcts}
+    return {f"p{p}": round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3) for p in pcts}
+
+
+# --- Synthetic corpus -----------------------------------------------------
+
+def generate_repo(root: Path, files: int, langs: List[str], median_lines: int, sigma: float,
+                  dup_rate: float, seed: int) -> List[Dict[str, Any]]:
+    """Write the synthetic tree under root/src; returns one record per file."""
+    rng = random.Random(seed)
+    records: List[Dict[str, Any]] = []
+    for i in range(files):
+        if records and rng.random() < dup_rate:
+            original = rng.choice([r for r in records if r["copy_of"] is None])
+            rel = f"src/vendor/v{i}/{Path(original['path']).name}"
+            lines = original["lines"]
+            copy_of = original["path"]
+        else:
+            lang = langs[i % len(langs)]
+            n = max(5, min(5000, int(rng.lognormvariate(math.log(median_lines), sigma))))
+            text = "".join(LANGS[lang].format(a=f"fn_{i}_{j}", b=rng.choice(VOCAB), c=f"k{i}x{j}",
+                                              w=" ".join(rng.sample(VOCAB, 3)))
+                           for j in range(n))
+            lines = text.splitlines(keepends=True)
+            rel = f"src/pkg{i % 50}/mod_{i}.{lang}"
+            copy_of = None
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(lines), encoding="utf-8")
+        records.append({"path": rel, "lines": lines, "copy_of": copy_of})
+    return records
+
+
+def generate_queries(records: List[Dict[str, Any]], n_queries: int, window: int, overlap: int,
+                     seed: int, with_copies: bool) -> List[Dict[str, Any]]:
+    """Queries built from a line's unique identifiers; gold = every chunk containing that line.
+
+    With dedup on, the original's chunk ids are gold whichever copy ingest keeps: the
+    kept chunk lists the others in alt_doc_ids, which eval credits. With dedup off every
+    copy is its own document, so `with_copies` adds the copies' chunk ids as well.
+    """
+    from ingest_to_opensearch import chunk_lines
+
+    rng = random.Random(seed + 1)
+    originals = [r for r in records if r["copy_of"] is None]
+    copies: Dict[str, List[str]] = {}
+    for r in records:
+        if with_copies and r["copy_of"] is not None:
+            copies.setdefault(r["copy_of"], []).append(r["path"])
+    out = []
+    for qi in range(n_queries):
+        rec = rng.choice(originals)
+        line_no = rng.randrange(1, len(rec["lines"]) + 1)
+        idents = re.findall(r"\b(?:fn|k)_?\d+(?:_|x)\d+\b", rec["lines"][line_no - 1])
+        starts = [s for s, e, _ in chunk_lines(rec["lines"], window, overlap) if s <= line_no <= e]
+        gold = [f"{p}:{s}" for p in [rec["path"]] + copies.get(rec["path"], []) for s in starts]
+        out.append({"id": f"q{qi}", "query": " ".join(idents), "gold": gold})
+    return out
+
+
+# --- In-memory stand-in for OpenSearch ------------------------------------
+
+class LocalBackend:
+    """Accepts _bulk action lists and answers BM25 searches, in process."""
+
+    K1, B = 1.2, 0.75
+    _TOKEN_RE = re.compile(r"\w+")
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.payload_bytes = 0
+        self._postings: Optional[Dict[str, List[tuple]]] = None
+
+    def bulk(self, actions: List[Dict[str, Any]]) -> None:
+        # serialize like bulk_post so encoding cost and payload size are measured
+        ndjson = "\n".join(json.dumps(a, ensure_ascii=False) for a in actions) + "\n"
+        self.payload_bytes += len(ndjson.encode("utf-8"))
+        for meta, body in zip(actions[::2], actions[1::2]):
+            if "index" in meta:
+                self.docs[meta["index"]["_id"]] = body
+            elif "update" in meta and meta["update"]["_id"] in self.docs:
+                self.docs[meta["update"]["_id"]].update(body.get("doc", {}))
+        self._postings = None
+
+    def _build(self) -> None:
+        self._ids = list(self.docs)
+        self._lengths = []
+        postings: Dict[str, List[tuple]] = {}
+        for i, uid in enumerate(self._ids):
+            tf: Dict[str, int] = {}
+            tokens = self._TOKEN_RE.findall(self.docs[uid].get("content", "").lower())
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            for t, c in tf.items():
+                postings.setdefault(t, []).append((i, c))
+            self._lengths.append(len(tokens))
+        self._avg_len = sum(self._lengths) / max(len(self._lengths), 1)
+        self._postings = postings
+
+    def search(self, query: str, k: int = 50, fields: List[str] = None) -> List[Dict[str, Any]]:
+        if self._postings is None:
+            self._build()
+        n = len(self._ids)
+        scores: Dict[int, float] = {}
+        for term in set(self._TOKEN_RE.findall(query.lower())):
+            plist = self._postings.get(term, ())
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for i, c in plist:
+                norm = c + self.K1 * (1 - self.B + self.B * self._lengths[i] / self._avg_len)
+                scores[i] = scores.get(i, 0.0) + idf * c * (self.K1 + 1) / norm
+        top = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+        hits = []
+        for i, score in top:
+            doc = self.docs[self._ids[i]]
+            src = {f: doc.get(f) for f in fields} if fields else doc
+            hits.append({"_id": self._ids[i], "_score": score, "_source": src})
+        return hits
+
+
+# --- Stages ---------------------------------------------------------------
+
+def bench_chunking(records: List[Dict[str, Any]], window: int, overlap: int) -> Dict[str, float]:
+    from ingest_to_opensearch import chunk_lines
+
+    t0 = time.perf_counter()
+    chunks = sum(len(chunk_lines(r["lines"], window, overlap)) for r in records)
+    dt = time.perf_counter() - t0
+    return {"seconds": round(dt, 4), "chunks_per_s": round(chunks / max(dt, 1e-9), 1)}
+
+
+def run(args) -> Dict[str, Any]:
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import ingest_to_opensearch as ingest_mod
+    import eval_rag
+    import telemetry
+
+    workdir = Path(tempfile.mkdtemp(prefix="orion-bench-"))
+    telemetry.LOG_DIR = str(workdir / "logs")  # keep synthetic runs out of the real event log
+    try:
+        t0 = time.perf_counter()
+        records = generate_repo(workdir, args.files, args.langs.split(","), args.median_lines,
+                                args.sigma, args.dup_rate, args.seed)
+        queries = generate_queries(records, args.queries, ingest_mod.WINDOW, ingest_mod.OVERLP, args.seed,
+                                   with_copies=args.no_dedup)
+        gen_s = time.perf_counter() - t0
+        total_bytes = sum((workdir / r["path"]).stat().st_size for r in records)
+
+        stages = {"chunk_lines": bench_chunking(records, ingest_mod.WINDOW, ingest_mod.OVERLP)}
+        ingest_mod.ROOT = workdir
+        t0 = time.perf_counter()
+        files = ingest_mod.iter_files(workdir)
+        stages["iter_files"] = {"seconds": round(time.perf_counter() - t0, 4), "files": len(files)}
+
+        backend = LocalBackend()
+        t0 = time.perf_counter()
+        stats = ingest_mod.ingest(files, dedup=not args.no_dedup, post=backend.bulk)
+        ingest_s = time.perf_counter() - t0
+        ingest = {
+            "seconds": round(ingest_s, 3),
+            "files": len(files),
+            "chunks": stats["chunks"],
+            "duplicates_dropped": stats["duplicates_dropped"],
+            "bytes": total_bytes,
+            "files_per_s": round(len(files) / ingest_s, 1),
+            "chunks_per_s": round(stats["chunks"] / ingest_s, 1),
+            "mb_per_s": round(total_bytes / 1e6 / ingest_s, 3),
+            "bulk_payload_mb": round(backend.payload_bytes / 1e6, 3),
+            "peak_rss_mb": rss_mb(),
+        }
+
+        eval_rag.bm25_hits = backend.search
+        eval_rag.INDEX_NAME = "bench"
+        gold = {q["id"]: q["gold"] for q in queries}
+        ks = [int(k) for k in args.k.split(",")]
+        backend.search("warmup", 1)  # build the inverted index outside the timed queries
+        t0 = time.perf_counter()
+        res = eval_rag.evaluate_rag(queries, gold, k=max(ks), strategy="bm25", ks=ks, bootstrap=0)
+        eval_s = time.perf_counter() - t0
+        latencies = [q["latency_ms"] for q in res["per_query"]]
+        evaluation = {
+            "seconds": round(eval_s, 3),
+            "queries": res["num_queries"],
+            "queries_per_s": round(res["num_queries"] / eval_s, 1),
+            "latency_ms": percentiles(latencies),
+            "metrics": res["metrics"],
+            "peak_rss_mb": rss_mb(),
+        }
+    finally:
+        telemetry.flush()
+        telemetry.ENABLED = False
+        if args.keep:
+            print(f"synthetic repo kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        sha = None
+    return {
+        "schema": SCHEMA_VERSION,
+        "git_sha": sha,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "keep")},
+        "generate_seconds": round(gen_s, 3),
+        "stages": stages,
+        "ingest": ingest,
+        "eval": evaluation,
+    }
+
+
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print every numeric result next to the baseline with its ratio."""
+    if baseline.get("params") != current.get("params"):
+        print("⚠️  parameters differ from the baseline; ratios may not be comparable")
+    base = _flatten({k: baseline.get(k, {}) for k in ("stages", "ingest", "eval")})
+    cur = _flatten({k: current.get(k, {}) for k in ("stages", "ingest", "eval")})
+    print(f"{'metric':44} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name in sorted(cur):
+        if name in base:
+            ratio = f"{cur[name] / base[name]:.2f}x" if base[name] else "-"
+            print(f"{name:44} {base[name]:12.3f} {cur[name]:12.3f} {ratio:>8}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Synthetic-corpus benchmark for ingestion and retrieval")
+    ap.add_argument("--files", type=int, default=500, help="number of files (default: 500)")
+    ap.add_argument("--langs", default="py,js,ts,go,java", help=f"comma list from {','.join(LANGS)}")
+    ap.add_argument("--median-lines", type=int, default=120, help="median lines per file (default: 120)")
+    ap.add_argument("--sigma", type=float, default=1.0, help="log-normal spread of file sizes (default: 1.0)")
+    ap.add_argument("--dup-rate", type=float, default=0.1, help="fraction of files that are copies (default: 0.1)")
+    ap.add_argument("--queries", type=int, default=200, help="number of queries (default: 200)")
+    ap.add_argument("--k", default="1,5,10,50", help="K values for the eval stage (default: 1,5,10,50)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no-dedup", action="store_true", help="disable ingest near-duplicate detection")
+    ap.add_argument("--keep", action="store_true", help="keep the generated repo")
+    ap.add_argument("--out", default="reports/bench.json", help="JSON report path (default: reports/bench.json)")
+    ap.add_argument("--compare", metavar="BASELINE", help="print ratios against an earlier report")
+    args = ap.parse_args()
+    if any(lang not in LANGS for lang in args.langs.split(",")):
+        ap.error(f"--langs must be a subset of {','.join(LANGS)}")
+
+    report = run(args)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({"ingest": report["ingest"], "eval": report["eval"]}, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,12 @@
 Quality Gates: Enforce coverage and mutation testing thresholds.
 Fails the build if metrics fall below minimum requirements.
 """
-import argparse, json, os, sys, xml.etree.ElementTree as ET
+import argparse, sys
 from glob import glob
 
+from report_reader import coverage_metrics, mutation_metrics
+import diff_coverage
+
 def find(path_patterns):
     """Find first matching file from pattern list."""
     for p in path_patterns:
@@ -17,24 +20,7 @@ def find(path_patterns):
 def cobertura_coverage(path):
     """Parse Cobertura XML coverage report."""
     try:
-        tree = ET.parse(path)
-        root = tree.getroot()
-
-        # Try line-rate attribute (0..1) - most common
-        rate = root.attrib.get("line-rate")
-        if rate is not None:
-            return float(rate)
-
-        # Fallback: sum lines-valid/lines-covered per package
-        lines_valid = lines_covered = 0
-        for c in root.iter("class"):
-            lv = c.attrib.get("lines-valid") or c.attrib.get("linesValid")
-            lc = c.attrib.get("lines-covered") or c.attrib.get("linesCovered")
-            if lv and lc:
-                lines_valid += int(float(lv))
-                lines_covered += int(float(lc))
-
-        return (lines_covered / lines_valid) if lines_valid else 0.0
+        return coverage_metrics(path)["line_rate"]
     except Exception as e:
         print(f"ERROR parsing coverage XML: {e}", file=sys.stderr)
         return 0.0
@@ -42,17 +28,7 @@ def cobertura_coverage(path):
 def mutation_score(path):
     """Parse Stryker mutation.json for mutation score."""
     try:
-        with open(path, encoding="utf-8") as f:
-            data = json.load(f)
-
-        killed = total = 0
-        for f in data.get("files", {}).values():
-            for m in f.get("mutants", []):
-                total += 1
-                if m.get("status", "").lower() == "killed":
-                    killed += 1
-
-        return (killed / total) if total else 0.0
+        return mutation_metrics(path)["score"]
     except Exception as e:
         print(f"ERROR parsing mutation JSON: {e}", file=sys.stderr)
         return 0.0
@@ -69,6 +45,12 @@ def main():
                     help="Skip coverage check (mutation only)")
     ap.add_argument("--skip-mutation", action="store_true",
                     help="Skip mutation check (coverage only)")
+    ap.add_argument("--diff-base",
+                    help="Also gate the lines added by `git diff DIFF_BASE` (e.g. origin/main...HEAD)")
+    ap.add_argument("--min-diff-coverage", type=float, default=0.80,
+                    help="Minimum coverage of added lines (0..1, default: 0.80)")
+    ap.add_argument("--min-file-coverage", type=float, default=0.0,
+                    help="Minimum coverage of added lines in each changed file (0..1, default: off)")
     args = ap.parse_args()
 
     # Find reports
@@ -101,6 +83,16 @@ def main():
     print(f"📊 Quality Metrics:")
     print(f"  Line coverage: {cov*100:.1f}% (min: {args.min_coverage*100:.1f}%)")
     print(f"  Mutation score: {mut*100:.1f}% (min: {args.min_mutation*100:.1f}%)")
+
+    diff = None
+    if args.diff_base and cov_path:
+        try:
+            diff = diff_coverage.compute(cov_path, args.diff_base)
+        except Exception as e:
+            print(f"ERROR computing diff coverage: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(f"  Diff coverage: {diff['rate']*100:.1f}% of {diff['lines']} added lines "
+              f"(min: {args.min_diff_coverage*100:.1f}%)")
     print()
 
     # Check thresholds
@@ -109,6 +101,14 @@ def main():
         failed.append(f"coverage {cov*100:.1f}% < {args.min_coverage*100:.1f}%")
     if not args.skip_mutation and mut < args.min_mutation:
         failed.append(f"mutation {mut*100:.1f}% < {args.min_mutation*100:.1f}%")
+    if diff and diff["lines"]:
+        if diff["rate"] < args.min_diff_coverage:
+            failed.append(f"diff coverage {diff['rate']*100:.1f}% < {args.min_diff_coverage*100:.1f}%")
+        for path, f in diff["files"].items():
+            rate = f["covered"] / f["lines"]
+            if rate < args.min_file_coverage:
+                failed.append(f"{path} coverage of added lines {rate*100:.1f}% < {args.min_file_coverage*100:.1f}%"
+                              f" (uncovered: {diff_coverage.format_ranges(f['uncovered'])})")
 
     if failed:
         print("❌ QUALITY GATES FAILED:", "; ".join(failed), file=sys.stderr)
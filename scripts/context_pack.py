@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Token-budgeted context assembly for retrieved chunks.
+
+Chunks are 80-line windows overlapping by 20 lines (CHUNK_LINES /
+CHUNK_OVERLAP), so neighbouring hits from one file repeat lines. assemble()
+groups hits by file content (sha_blob, falling back to path), coalesces
+overlapping or adjacent line ranges into single spans, then packs spans by
+score into a caller-given token budget and reports how many tokens were saved.
+"""
+from typing import Callable, Dict, List, Tuple
+
+CHARS_PER_TOKEN = 4  # rough estimate for code; pass token_fn for a real tokenizer
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _fields(hit: Dict) -> Tuple[Dict, float]:
+    """Accept raw OpenSearch hits ({_score, _source}) or flat chunk dicts."""
+    src = hit.get("_source", hit)
+    return src, float(hit.get("_score", src.get("score", 0.0)) or 0.0)
+
+
+def merge_hits(hits: List[Dict]) -> List[Dict]:
+    """Coalesce hits into non-overlapping spans, one set per distinct file content."""
+    groups: Dict[str, Dict] = {}
+    for hit in hits:
+        src, score = _fields(hit)
+        if "content" not in src or "start_line" not in src:
+            continue
+        key = src.get("sha_blob") or src["path"]
+        group = groups.setdefault(key, {"path": src["path"], "sha_blob": src.get("sha_blob"),
+                                        "alt_paths": [], "chunks": []})
+        if src["path"] != group["path"] and src["path"] not in group["alt_paths"]:
+            group["alt_paths"].append(src["path"])
+        group["chunks"].append((int(src["start_line"]), src["content"], score))
+
+    spans = []
+    for group in groups.values():
+        current = None
+        for start, content, score in sorted(group["chunks"], key=lambda c: c[0]):
+            lines = content.splitlines(keepends=True)
+            end = start + len(lines) - 1
+            if current is not None and start <= current["end_line"] + 1:
+                # extend with the lines past the current end (overlap is dropped)
+                current["lines"].extend(lines[current["end_line"] + 1 - start:])
+                current["end_line"] = max(current["end_line"], end)
+                current["score"] = max(current["score"], score)
+                current["hits"] += 1
+                continue
+            current = {"path": group["path"], "sha_blob": group["sha_blob"], "alt_paths": group["alt_paths"],
+                       "start_line": start, "end_line": end, "score": score, "hits": 1, "lines": lines}
+            spans.append(current)
+    for span in spans:
+        span["text"] = "".join(span.pop("lines"))
+    return spans
+
+
+def assemble(hits: List[Dict], budget_tokens: int,
+             token_fn: Callable[[str], int] = estimate_tokens) -> Tuple[List[Dict], Dict[str, int]]:
+    """Merged spans packed by descending score into `budget_tokens`, plus token stats.
+
+    A span that does not fit is trimmed to its leading lines (marked `truncated`).
+    """
+    raw_tokens = 0
+    for hit in hits:
+        src, _ = _fields(hit)
+        raw_tokens += token_fn(src.get("content", ""))
+    spans = merge_hits(hits)
+    for span in spans:
+        span["tokens"] = token_fn(span["text"])
+
+    packed, used = [], 0
+    for span in sorted(spans, key=lambda s: s["score"], reverse=True):
+        if used + span["tokens"] <= budget_tokens:
+            packed.append(span)
+            used += span["tokens"]
+            continue
+        # trim an oversized span to the leading lines that still fit
+        kept, kept_tokens = [], 0
+        for line in span["text"].splitlines(keepends=True):
+            t = token_fn(line)
+            if used + kept_tokens + t > budget_tokens:
+                break
+            kept.append(line)
+            kept_tokens += t
+        if kept:
+            packed.append(dict(span, text="".join(kept), tokens=kept_tokens, truncated=True,
+                               end_line=span["start_line"] + len(kept) - 1))
+            used += kept_tokens
+
+    merged_tokens = sum(s["tokens"] for s in spans)
+    stats = {
+        "hits": len(hits),
+        "spans": len(spans),
+        "spans_packed": len(packed),
+        "raw_tokens": raw_tokens,
+        "merged_tokens": merged_tokens,
+        "packed_tokens": used,
+        "tokens_saved": raw_tokens - merged_tokens,
+    }
+    return packed, stats
+
+
+def render(spans: List[Dict]) -> str:
+    """Prompt text: one fenced block per span, headed by path and line range."""
+    parts = []
+    for span in spans:
+        text = span["text"] if span["text"].endswith("\n") else span["text"] + "\n"
+        parts.append(f"# {span['path']}:{span['start_line']}-{span['end_line']}\n```\n{text}```\n")
+    return "\n".join(parts)
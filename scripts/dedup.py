@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Near-duplicate chunk detection for ingestion: MinHash signatures over token
+shingles, LSH banding to find candidates in sub-linear time, and an exact
+shingle Jaccard check against the threshold before a chunk is treated as a
+duplicate of an earlier (canonical) one. Chunks of the same file are never
+matched with each other (overlapping windows are not copies).
+
+numpy speeds up signature computation when installed (imported on first use,
+so importing this module stays cheap); results are identical without it.
+"""
+import random
+import re
+import zlib
+from array import array
+from typing import Iterable, List, Optional, Set
+
+NUM_PERM = 64
+BANDS, ROWS = 8, 8  # BANDS * ROWS == NUM_PERM; P(candidate | J=0.9) ~ 0.99
+SHINGLE = 5
+_MASK64 = (1 << 64) - 1
+
+# multiply-shift hashing: h(x) = ((a*x + b) mod 2**64) >> 32 with random 64-bit a (odd), b.
+# numpy's uint64 arithmetic wraps mod 2**64, so both code paths agree bit for bit.
+_rng = random.Random(0x5EED)
+_A = [_rng.randrange(0, 1 << 64) | 1 for _ in range(NUM_PERM)]
+_B = [_rng.randrange(0, 1 << 64) for _ in range(NUM_PERM)]
+_np = None  # (numpy, A, B) after the first minhash(), or False without numpy
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def shingles(text: str, size: int = SHINGLE) -> Set[int]:
+    """32-bit hashes of overlapping token n-grams (whitespace-insensitive)."""
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return set()
+    if len(tokens) <= size:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))}
+    return {zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8"))
+            for i in range(len(tokens) - size + 1)}
+
+
+def minhash(hashes: Iterable[int]) -> Optional[List[int]]:
+    """NUM_PERM-value MinHash signature; None for empty input."""
+    global _np
+    hashes = list(hashes)
+    if not hashes:
+        return None
+    if _np is None:
+        try:
+            import numpy as np  # type: ignore
+            _np = (np, np.array(_A, dtype=np.uint64)[:, None], np.array(_B, dtype=np.uint64)[:, None])
+        except Exception:
+            _np = False
+    if _np:
+        np, a, b = _np
+        x = np.array(hashes, dtype=np.uint64)[None, :]
+        with np.errstate(over="ignore"):
+            return ((a * x + b) >> np.uint64(32)).min(axis=1).tolist()
+    return [min(((a * x + b) & _MASK64) >> 32 for x in hashes) for a, b in zip(_A, _B)]
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class NearDupIndex:
+    """LSH index of canonical chunks (sorted shingle hashes kept for the exact check)."""
+
+    def __init__(self, threshold: float = 0.9):
+        self.threshold = threshold
+        self.buckets = [dict() for _ in range(BANDS)]
+        self.canonical = {}  # canonical key -> (group, array('I') of shingle hashes)
+
+    def find_or_add(self, key: str, hashes: Set[int], group: str = None) -> Optional[str]:
+        """Key of an earlier near-duplicate of `hashes`, or None after registering it as canonical.
+
+        Candidates from the same `group` (file path) are skipped; a candidate only counts
+        once its exact shingle Jaccard reaches the threshold.
+        """
+        sig = minhash(hashes)
+        if sig is None:
+            return None
+        bands = [hash(tuple(sig[b * ROWS:(b + 1) * ROWS])) for b in range(BANDS)]
+        checked = set()
+        for b, band in enumerate(bands):
+            for cand in self.buckets[b].get(band, ()):
+                if cand in checked:
+                    continue
+                checked.add(cand)
+                cand_group, cand_hashes = self.canonical[cand]
+                if group is not None and cand_group == group:
+                    continue
+                if jaccard(hashes, set(cand_hashes)) >= self.threshold:
+                    return cand
+        self.canonical[key] = (group, array("I", sorted(hashes)))
+        for b, band in enumerate(bands):
+            self.buckets[b].setdefault(band, []).append(key)
+        return None
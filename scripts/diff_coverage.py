@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Diff coverage: intersect the lines added by `git diff` with the per-file
+covered-line index built from a Cobertura report (report_reader).
+
+Only added lines the report marks as executable count; files absent from
+the report (docs, configs, untracked languages) are ignored.
+"""
+import os
+import re
+import subprocess
+
+from report_reader import coverage_line_index, has_bit
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+_C_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, '"': 34, "\\": 92}
+
+
+def diff_header_path(name):
+    """Path from a `+++ ` header: drop the tab git appends to names with spaces and
+    unquote C-quoted names ("a\\tb", octal-escaped bytes)."""
+    if name.endswith("\t"):
+        name = name[:-1]
+    if len(name) < 2 or not (name.startswith('"') and name.endswith('"')):
+        return name
+    body, out, i = name[1:-1], bytearray(), 0
+    while i < len(body):
+        ch = body[i]
+        if ch == "\\" and i + 1 < len(body):
+            nxt = body[i + 1]
+            if nxt in "01234567":
+                out.append(int(body[i + 1:i + 4], 8)); i += 4; continue
+            out.append(_C_ESCAPES.get(nxt, ord(nxt))); i += 2; continue
+        out.extend(ch.encode("utf-8")); i += 1
+    return out.decode("utf-8", errors="replace")
+
+
+def added_lines(base):
+    """Map repo-relative path -> sorted added line numbers for `git diff <base>`.
+
+    `base` is passed to git as-is: `origin/main` compares against the working
+    tree, `origin/main...HEAD` against the merge base.
+    """
+    out = subprocess.check_output(
+        ["git", "-c", "core.quotepath=off", "diff", "-U0", "--no-color", "--no-ext-diff",
+         "--src-prefix=a/", "--dst-prefix=b/", base],
+    ).decode("utf-8", errors="replace")
+    added, current = {}, None
+    for line in out.splitlines():
+        if line.startswith("+++ "):
+            target = diff_header_path(line[4:])
+            current = added.setdefault(target[2:], []) if target.startswith("b/") else None
+        elif current is not None and line.startswith("@@"):
+            m = _HUNK_RE.match(line)
+            if m:
+                start, count = int(m.group(1)), int(m.group(2) or 1)
+                current.extend(range(start, start + count))
+    return {path: lines for path, lines in added.items() if lines}
+
+
+def repo_root():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--show-toplevel"]).decode().strip()
+    except Exception:
+        return os.getcwd()
+
+
+def resolve_paths(index, top):
+    """Map repo-relative paths to the report's filenames (via <source> roots, then suffix)."""
+    by_repo = {}
+    for name in index["files"]:
+        candidates = [os.path.join(src, name) for src in index["sources"]] or [name]
+        for cand in candidates:
+            rel = os.path.relpath(os.path.abspath(cand), top).replace(os.sep, "/")
+            if not rel.startswith("../"):
+                by_repo.setdefault(rel, name)
+        by_repo.setdefault(name.replace(os.sep, "/"), name)
+    return by_repo
+
+
+def _lookup(by_repo, path):
+    if path in by_repo:
+        return by_repo[path]
+    for rel, name in by_repo.items():  # report paths relative to a sub-package root
+        if path.endswith("/" + rel):
+            return name
+    return None
+
+
+def diff_coverage(index, added, top=None):
+    """Covered/total executable added lines, overall and per file."""
+    by_repo = resolve_paths(index, top or repo_root())
+    files, total, covered = {}, 0, 0
+    for path, lines in sorted(added.items()):
+        name = _lookup(by_repo, path)
+        if name is None:
+            continue
+        valid, hit = index["files"][name]
+        executable = [n for n in lines if has_bit(valid, n)]
+        if not executable:
+            continue
+        uncovered = [n for n in executable if not has_bit(hit, n)]
+        files[path] = {
+            "lines": len(executable),
+            "covered": len(executable) - len(uncovered),
+            "uncovered": uncovered,
+        }
+        total += len(executable)
+        covered += len(executable) - len(uncovered)
+    return {
+        "lines": total,
+        "covered": covered,
+        "rate": (covered / total) if total else 1.0,
+        "files": files,
+    }
+
+
+def compute(report_path, base):
+    """Diff coverage of `git diff <base>` against a Cobertura report."""
+    return diff_coverage(coverage_line_index(report_path), added_lines(base))
+
+
+def format_ranges(lines):
+    """[1, 2, 3, 7, 9, 10] -> '1-3, 7, 9-10'."""
+    out, start, prev = [], None, None
+    for n in lines:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            out.append(f"{start}-{prev}" if prev != start else str(start))
+            start = prev = n
+    if start is not None:
+        out.append(f"{start}-{prev}" if prev != start else str(start))
+    return ", ".join(out)
@@ -9,18 +9,33 @@ Supports three retrieval strategies:
 """
 
 import argparse
+import itertools
 import json
+import math
 import os
+import sqlite3
 import sys
-from typing import List, Dict, Any, Tuple
+import time
+from typing import List, Dict, Any, Iterator, Tuple
 import urllib3
 
+import metrics_store
+import telemetry
+from context_pack import assemble
+from quantize import MODES as QUANT_MODES, index_name, quantize, rescore
+
 try:
     import requests
 except ImportError:
     print("❌ Missing 'requests' library. Install: pip install requests")
     sys.exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    print("❌ Missing 'numpy' library. Install: pip install numpy")
+    sys.exit(1)
+
 # Disable SSL warnings for self-signed certs
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -30,6 +45,16 @@ OS_USER = os.getenv("OS_USER", "admin")
 OS_PASS = os.getenv("OS_PASS", "MyS3curePassw0rd!2025")
 INDEX_NAME = "code-chunks"
 
+# Vector search: same model as ingestion; non-float modes query <INDEX_NAME>-<mode>
+EMB_MODEL_NAME = os.getenv("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+QUANT_MODE = os.getenv("EMB_QUANT", "float")
+RESCORE_OVERSAMPLE = int(os.getenv("RESCORE_OVERSAMPLE", "4"))  # <= 1 disables rescoring
+_NO_F32_INDEXES = set()  # quantized indexes ingested without --rescore-store (nothing to rescore with)
+_emb_model = None
+
+SOURCE_FIELDS = ["doc_id", "path", "start_line", "end_line", "alt_doc_ids"]
+CONTEXT_FIELDS = ["content", "sha_blob"]  # needed by --context-budget
+
 
 def load_jsonl(filepath: str) -> List[Dict[str, Any]]:
     """Load JSONL file."""
@@ -41,12 +66,35 @@ def load_jsonl(filepath: str) -> List[Dict[str, Any]]:
         return [json.loads(line) for line in f if line.strip()]
 
 
-def bm25_search(query: str, k: int = 50) -> List[str]:
-    """BM25 keyword search."""
+def iter_jsonl(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Lazily yield records from a JSONL file."""
+    if not os.path.exists(filepath):
+        print(f"❌ File not found: {filepath}")
+        sys.exit(1)
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _doc_id(hit: Dict[str, Any]) -> str:
+    # Use doc_id if available, otherwise fallback to path:start_line
+    src = hit["_source"]
+    return src.get("doc_id", f"{src['path']}:{src.get('start_line', 1)}")
+
+
+def _doc_ids(hit: Dict[str, Any]) -> Tuple[str, ...]:
+    """Hit doc id plus the ids of near-duplicate copies folded into it at ingest (alt_doc_ids)."""
+    return (_doc_id(hit),) + tuple(hit["_source"].get("alt_doc_ids") or ())
+
+
+def bm25_hits(query: str, k: int = 50, fields: List[str] = None) -> List[Dict[str, Any]]:
+    """BM25 keyword search, raw hits."""
     payload = {
         "query": {"match": {"content": query}},
         "size": k,
-        "_source": ["doc_id", "path", "start_line", "end_line"]
+        "_source": fields or SOURCE_FIELDS
     }
 
     resp = requests.post(
@@ -58,78 +106,281 @@ def bm25_search(query: str, k: int = 50) -> List[str]:
     )
     resp.raise_for_status()
 
+    return resp.json().get("hits", {}).get("hits", [])
+
+
+def bm25_search(query: str, k: int = 50) -> List[str]:
+    """BM25 keyword search."""
+    return [_doc_id(h) for h in bm25_hits(query, k)]
+
+
+def embed_query(query: str):
+    """Embed a query with the ingestion model (loaded on first use); None if unavailable."""
+    global _emb_model
+    if _emb_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+            _emb_model = SentenceTransformer(EMB_MODEL_NAME)
+        except Exception as e:
+            print(f"⚠️  Embeddings unavailable ({e}); vector search falls back to BM25")
+            _emb_model = False
+    if not _emb_model:
+        return None
+    return _emb_model.encode(query, normalize_embeddings=True).tolist()
+
+
+def vector_hits(query: str, k: int = 50, fields: List[str] = None) -> List[Dict[str, Any]]:
+    """Vector semantic search (requires embeddings), raw hits.
+
+    The query is quantized like the documents (QUANT_MODE); for int8/binary the
+    top k * RESCORE_OVERSAMPLE candidates are rescored with full-precision vectors
+    when the index stores them (ingest --rescore-store).
+    """
+    vec = embed_query(query)
+    if vec is None:
+        return bm25_hits(query, k, fields)
+
+    index = index_name(INDEX_NAME, QUANT_MODE)
+    rescoring = QUANT_MODE != "float" and RESCORE_OVERSAMPLE > 1 and index not in _NO_F32_INDEXES
+    size = k * RESCORE_OVERSAMPLE if rescoring else k
+    payload = {
+        "query": {"knn": {"embedding": {"vector": quantize(vec, QUANT_MODE), "k": size}}},
+        "size": size,
+        "_source": (fields or SOURCE_FIELDS) + (["embedding_f32"] if rescoring else [])
+    }
+
+    resp = requests.post(
+        f"{OS_URL}/{index}/_search",
+        json=payload,
+        auth=(OS_USER, OS_PASS),
+        verify=False,
+        timeout=30
+    )
+    resp.raise_for_status()
+
     hits = resp.json().get("hits", {}).get("hits", [])
-    # Use doc_id if available, otherwise fallback to path:start_line
-    return [
-        h['_source'].get('doc_id', f"{h['_source']['path']}:{h['_source'].get('start_line', 1)}")
-        for h in hits
-    ]
+    if rescoring:
+        if hits and not any(h.get("_source", {}).get("embedding_f32") for h in hits):
+            _NO_F32_INDEXES.add(index)  # stop oversampling; ANN order is all we have
+        else:
+            hits = rescore(vec, hits)
+    return hits[:k]
 
 
 def vector_search(query: str, k: int = 50) -> List[str]:
     """Vector semantic search (requires embeddings)."""
-    # This is a placeholder - actual implementation would:
-    # 1. Embed the query using the same model (all-MiniLM-L6-v2)
-    # 2. Perform KNN search
-    # For now, falls back to BM25
-    print("⚠️  Vector search not implemented, using BM25 fallback")
-    return bm25_search(query, k)
+    return [_doc_id(h) for h in vector_hits(query, k)]
 
 
-def hybrid_search(query: str, k: int = 50) -> List[str]:
-    """Hybrid search: BM25 + Vector with score fusion."""
-    # Get results from both methods
-    bm25_results = set(bm25_search(query, k))
-    vector_results = set(vector_search(query, k))
-
+def hybrid_hits(query: str, k: int = 50, fields: List[str] = None) -> List[Dict[str, Any]]:
+    """Hybrid search: BM25 + Vector, raw hits."""
     # Simple fusion: union with BM25 priority
-    combined = list(bm25_results) + [r for r in vector_results if r not in bm25_results]
+    combined, seen = [], set()
+    for hit in bm25_hits(query, k, fields) + vector_hits(query, k, fields):
+        doc_id = _doc_id(hit)
+        if doc_id not in seen:
+            seen.add(doc_id)
+            combined.append(hit)
     return combined[:k]
 
 
-def calculate_recall_at_k(retrieved: List[str], gold: List[str], k: int) -> float:
-    """Calculate Recall@K metric."""
-    if not gold:
+def hybrid_search(query: str, k: int = 50) -> List[str]:
+    """Hybrid search: BM25 + Vector with score fusion."""
+    return [_doc_id(h) for h in hybrid_hits(query, k)]
+
+
+def index_size_bytes(index: str):
+    """On-disk store size of an index, or None if it cannot be read."""
+    try:
+        resp = requests.get(
+            f"{OS_URL}/_cat/indices/{index}",
+            params={"format": "json", "bytes": "b"},
+            auth=(OS_USER, OS_PASS),
+            verify=False,
+            timeout=30
+        )
+        resp.raise_for_status()
+        return int(resp.json()[0]["store.size"])
+    except Exception:
+        return None
+
+
+def compare_quantization(
+    queries: List[Dict[str, Any]],
+    gold_data: Dict[str, List[str]],
+    ks: List[int],
+    modes: List[str]
+) -> Dict[str, Any]:
+    """Vector-search size/latency/recall trade-off for each embedding storage mode."""
+    global QUANT_MODE
+    saved = QUANT_MODE
+    out = {}
+    try:
+        for mode in modes:
+            QUANT_MODE = mode
+            print(f"🔍 Quantization mode {mode} (index {index_name(INDEX_NAME, mode)})...")
+            res = evaluate_rag(queries, gold_data, k=max(ks), strategy="vector", ks=ks, bootstrap=0)
+            out[mode] = {
+                "index": index_name(INDEX_NAME, mode),
+                "index_bytes": index_size_bytes(index_name(INDEX_NAME, mode)),
+                "metrics": res["metrics"],
+                "latency_ms": res["latency_ms"]
+            }
+    finally:
+        QUANT_MODE = saved
+    return out
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0..100)."""
+    if not values:
         return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
 
-    retrieved_set = set(retrieved[:k])
-    gold_set = set(gold)
 
-    hits = len(retrieved_set.intersection(gold_set))
-    return hits / len(gold_set)
-
-
-def calculate_mrr(retrieved: List[str], gold: List[str]) -> float:
-    """Calculate Mean Reciprocal Rank."""
-    if not gold:
-        return 0.0
-
-    gold_set = set(gold)
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Mean/p50/p95 retrieval latency in milliseconds."""
+    return {
+        "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2)
+    }
 
-    for idx, doc in enumerate(retrieved, start=1):
-        if doc in gold_set:
-            return 1.0 / idx
 
-    return 0.0
+def relevance_matrix(
+    retrieved_lists: List[List[Any]],
+    gold_lists: List[List[str]],
+    max_k: int
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Queries x ranks boolean relevance matrix plus number of relevant docs per query.
+
+    A retrieved entry is a doc id or a tuple of equivalent ids (a canonical chunk and
+    its deduplicated copies); it is relevant if any of them is an unmatched gold doc.
+    A document retrieved twice only counts at its first rank.
+    """
+    rel = np.zeros((len(retrieved_lists), max_k), dtype=bool)
+    n_rel = np.zeros(len(retrieved_lists), dtype=np.int64)
+    for i, (retrieved, gold) in enumerate(zip(retrieved_lists, gold_lists)):
+        gold_set = set(gold)
+        n_rel[i] = len(gold_set)
+        seen = set()
+        for j, doc in enumerate(retrieved[:max_k]):
+            matched = gold_set.intersection((doc,) if isinstance(doc, str) else doc) - seen
+            if matched:
+                rel[i, j] = True
+                seen.update(matched)
+    return rel, n_rel
+
+
+def rank_metrics(rel: "np.ndarray", n_rel: "np.ndarray", ks: List[int]) -> Dict[str, "np.ndarray"]:
+    """Per-query Recall@K, Precision@K, nDCG@K for every K, plus AP and RR, in one pass."""
+    num_q, max_k = rel.shape
+    has_gold = n_rel > 0
+    safe_n = np.maximum(n_rel, 1)
+    hits = np.cumsum(rel, axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, max_k + 2))
+    dcg = np.cumsum(rel * discounts, axis=1)
+    ideal = np.cumsum(discounts)
+
+    out: Dict[str, np.ndarray] = {}
+    for k in ks:
+        col = min(k, max_k) - 1
+        out[f"recall@{k}"] = np.where(has_gold, hits[:, col] / safe_n, 0.0)
+        out[f"precision@{k}"] = hits[:, col] / k
+        idcg = ideal[np.minimum(safe_n, min(k, max_k)) - 1]
+        out[f"ndcg@{k}"] = np.where(has_gold, dcg[:, col] / idcg, 0.0)
+
+    precision_at_rank = hits / np.arange(1, max_k + 1)
+    out["map"] = np.where(has_gold, (precision_at_rank * rel).sum(axis=1) / safe_n, 0.0)
+    first = rel.argmax(axis=1)
+    out["mrr"] = np.where(rel.any(axis=1), 1.0 / (first + 1), 0.0)
+    return out
+
+
+def bootstrap_ci(
+    per_query: Dict[str, "np.ndarray"],
+    n_resamples: int = 1000,
+    alpha: float = 0.05,
+    seed: int = 0,
+    batch: int = 100
+) -> Dict[str, List[float]]:
+    """Percentile bootstrap CIs for the mean of every metric.
+
+    Uses Poisson(1) resampling weights so each batch of resamples is a single
+    (resamples x queries) @ (queries x metrics) product.
+    """
+    names = list(per_query)
+    if not names or n_resamples <= 0:
+        return {}
+    values = np.stack([per_query[n] for n in names], axis=1)  # queries x metrics
+    if values.shape[0] == 0:
+        return {}
+    rng = np.random.default_rng(seed)
+    means = []
+    for start in range(0, n_resamples, batch):
+        weights = rng.poisson(1.0, size=(min(batch, n_resamples - start), values.shape[0]))
+        totals = np.maximum(weights.sum(axis=1, keepdims=True), 1)
+        means.append(weights @ values / totals)
+    means = np.concatenate(means)
+    lo, hi = np.quantile(means, [alpha / 2, 1 - alpha / 2], axis=0)
+    return {n: [round(float(lo[i]), 4), round(float(hi[i]), 4)] for i, n in enumerate(names)}
+
+
+def get_hits_fn(strategy: str):
+    return {
+        "bm25": bm25_hits,
+        "vector": vector_hits,
+        "hybrid": hybrid_hits
+    }.get(strategy, bm25_hits)
+
+
+def retrieve(strategy: str, query: str, k: int, context_budget: int = None):
+    """Ranked doc id tuples (see _doc_ids), plus context-assembly token stats when a budget is given."""
+    t0 = time.perf_counter()
+    hits = get_hits_fn(strategy)(query, k, SOURCE_FIELDS + CONTEXT_FIELDS if context_budget else None)
+    stats = assemble(hits, context_budget)[1] if context_budget else None
+    quant = QUANT_MODE if strategy != "bm25" else None
+    telemetry.emit("rag_query", stage=f"rag.{strategy}", duration_ms=round((time.perf_counter() - t0) * 1000, 3),
+                   k=k, max_score=hits[0].get("_score") if hits else None, hits=len(hits), items=1,
+                   quant=quant, reranker="f32-rescore" if quant and quant != "float" and RESCORE_OVERSAMPLE > 1
+                   and index_name(INDEX_NAME, quant) not in _NO_F32_INDEXES else "none")
+    return [_doc_ids(h) for h in hits], stats
+
+
+def context_summary(totals: Dict[str, int], num_queries: int, budget: int) -> Dict[str, Any]:
+    """Average per-query token counts from summed assemble() stats."""
+    n = max(num_queries, 1)
+    raw = totals.get("raw_tokens", 0)
+    return {
+        "budget": budget,
+        "avg_raw_tokens": round(raw / n, 1),
+        "avg_merged_tokens": round(totals.get("merged_tokens", 0) / n, 1),
+        "avg_packed_tokens": round(totals.get("packed_tokens", 0) / n, 1),
+        "tokens_saved_pct": round(100 * totals.get("tokens_saved", 0) / raw, 2) if raw else 0.0
+    }
 
 
 def evaluate_rag(
     queries: List[Dict[str, Any]],
     gold_data: Dict[str, List[str]],
     k: int = 50,
-    strategy: str = "bm25"
+    strategy: str = "bm25",
+    ks: List[int] = None,
+    bootstrap: int = 1000,
+    seed: int = 0,
+    context_budget: int = None
 ) -> Dict[str, Any]:
-    """Run RAG evaluation."""
+    """Run RAG evaluation: retrieve once at max K, then score every K in one vectorized pass."""
 
-    search_fn = {
-        "bm25": bm25_search,
-        "vector": vector_search,
-        "hybrid": hybrid_search
-    }.get(strategy, bm25_search)
+    ks = sorted(set(ks or [k]))
+    max_k = max(ks)
 
-    results = []
-    total_recall = 0.0
-    total_mrr = 0.0
+    query_ids, query_texts = [], []
+    retrieved_lists, gold_lists = [], []
+    latencies = []
+    context_totals: Dict[str, int] = {}
 
     for q in queries:
         query_id = q.get("id", q.get("query", ""))
@@ -138,82 +389,393 @@ def evaluate_rag(
         if not query_text:
             continue
 
-        # Get gold standard
-        gold = gold_data.get(query_id, [])
-
         # Retrieve documents
-        retrieved = search_fn(query_text, k)
-
-        # Calculate metrics
-        recall = calculate_recall_at_k(retrieved, gold, k)
-        mrr = calculate_mrr(retrieved, gold)
-
-        total_recall += recall
-        total_mrr += mrr
-
-        results.append({
-            "query_id": query_id,
-            "query": query_text,
-            "retrieved_count": len(retrieved),
-            "gold_count": len(gold),
-            "recall@k": round(recall, 4),
-            "mrr": round(mrr, 4)
-        })
-
-    num_queries = len(results)
-    avg_recall = total_recall / num_queries if num_queries > 0 else 0.0
-    avg_mrr = total_mrr / num_queries if num_queries > 0 else 0.0
+        t0 = time.perf_counter()
+        retrieved, context_stats = retrieve(strategy, query_text, max_k, context_budget)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        for name, value in (context_stats or {}).items():
+            context_totals[name] = context_totals.get(name, 0) + value
+
+        query_ids.append(query_id)
+        query_texts.append(query_text)
+        retrieved_lists.append(retrieved)
+        gold_lists.append(gold_data.get(query_id, []))
+
+    rel, n_rel = relevance_matrix(retrieved_lists, gold_lists, max_k)
+    per_query = rank_metrics(rel, n_rel, ks)
+    num_queries = len(query_ids)
+    metrics = {name: round(float(v.mean()), 4) if num_queries else 0.0 for name, v in per_query.items()}
+
+    results = [
+        {
+            "query_id": query_ids[i],
+            "query": query_texts[i],
+            "retrieved_count": len(retrieved_lists[i]),
+            "gold_count": len(gold_lists[i]),
+            "recall@k": round(float(per_query[f"recall@{max_k}"][i]), 4),
+            "mrr": round(float(per_query["mrr"][i]), 4),
+            "latency_ms": round(latencies[i], 2)
+        }
+        for i in range(num_queries)
+    ]
 
-    return {
+    out = {
         "strategy": strategy,
-        "k": k,
+        "k": max_k,
+        "ks": ks,
         "num_queries": num_queries,
-        "avg_recall@k": round(avg_recall, 4),
-        "avg_mrr": round(avg_mrr, 4),
+        "avg_recall@k": metrics.get(f"recall@{max_k}", 0.0),
+        "avg_mrr": metrics.get("mrr", 0.0),
+        "metrics": metrics,
+        "ci95": bootstrap_ci(per_query, n_resamples=bootstrap, seed=seed),
+        "latency_ms": latency_summary(latencies),
         "per_query": results
     }
+    if context_budget:
+        out["context"] = context_summary(context_totals, num_queries, context_budget)
+    return out
+
+
+# --- Streaming mode -------------------------------------------------------
+# Queries are read lazily, gold docs come from an on-disk SQLite index, each
+# query's result is appended to a JSONL file, and a checkpoint written after
+# every batch lets a rerun resume where the previous one stopped. Aggregates
+# (metric sums, Poisson-bootstrap replicate sums, a latency histogram) have a
+# fixed size, so memory stays flat regardless of the number of queries.
+
+LATENCY_BUCKET = 1.05  # histogram bucket growth factor (~2.5% percentile error)
+
+
+def _file_stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def open_gold_index(gold_path: str, index_path: str) -> sqlite3.Connection:
+    """SQLite id -> relevant docs index for a gold JSONL file, rebuilt when the file changes."""
+    conn = sqlite3.connect(index_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (stamp TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS gold (id TEXT PRIMARY KEY, docs TEXT NOT NULL)")
+    stamp = json.dumps(_file_stamp(gold_path))
+    row = conn.execute("SELECT stamp FROM meta").fetchone()
+    if row is None or row[0] != stamp:
+        print(f"📊 Indexing gold standard {gold_path} -> {index_path}...")
+        with conn:
+            conn.execute("DELETE FROM gold")
+            conn.execute("DELETE FROM meta")
+            conn.executemany(
+                "INSERT OR REPLACE INTO gold (id, docs) VALUES (?, ?)",
+                ((str(item.get("id", item.get("query", ""))),
+                  json.dumps(item.get("relevant_docs", item.get("docs", []))))
+                 for item in iter_jsonl(gold_path)),
+            )
+            conn.execute("INSERT INTO meta (stamp) VALUES (?)", (stamp,))
+    return conn
+
+
+def lookup_gold(conn: sqlite3.Connection, query_ids: List[str]) -> Dict[str, List[str]]:
+    found = {}
+    for start in range(0, len(query_ids), 500):  # stay under SQLite's bound-parameter limit
+        chunk = query_ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        for qid, docs in conn.execute(f"SELECT id, docs FROM gold WHERE id IN ({marks})", chunk):
+            found[qid] = json.loads(docs)
+    return found
+
+
+class StreamingAggregate:
+    """Fixed-size running aggregates for the streaming evaluator."""
+
+    def __init__(self, names: List[str], n_resamples: int):
+        self.names = names
+        self.count = 0
+        self.sums = np.zeros(len(names))
+        self.boot_weights = np.zeros(n_resamples)
+        self.boot_sums = np.zeros((n_resamples, len(names)))
+        self.latency_sum = 0.0
+        self.latency_hist: Dict[int, int] = {}
+
+    def add(self, per_query: Dict[str, "np.ndarray"], latencies: List[float], rng) -> None:
+        values = np.stack([per_query[n] for n in self.names], axis=1)  # queries x metrics
+        self.count += values.shape[0]
+        self.sums += values.sum(axis=0)
+        if len(self.boot_weights):
+            weights = rng.poisson(1.0, size=(len(self.boot_weights), values.shape[0]))
+            self.boot_weights += weights.sum(axis=1)
+            self.boot_sums += weights @ values
+        self.latency_sum += sum(latencies)
+        for ms in latencies:
+            bucket = int(math.floor(math.log(max(ms, 1e-3)) / math.log(LATENCY_BUCKET)))
+            self.latency_hist[bucket] = self.latency_hist.get(bucket, 0) + 1
+
+    def metrics(self) -> Dict[str, float]:
+        if not self.count:
+            return {n: 0.0 for n in self.names}
+        return {n: round(float(v), 4) for n, v in zip(self.names, self.sums / self.count)}
+
+    def ci95(self) -> Dict[str, List[float]]:
+        if not self.count or not len(self.boot_weights):
+            return {}
+        means = self.boot_sums / np.maximum(self.boot_weights, 1)[:, None]
+        lo, hi = np.quantile(means, [0.025, 0.975], axis=0)
+        return {n: [round(float(lo[i]), 4), round(float(hi[i]), 4)] for i, n in enumerate(self.names)}
+
+    def latency_percentile(self, pct: float) -> float:
+        total = sum(self.latency_hist.values())
+        if not total:
+            return 0.0
+        target = math.ceil(pct / 100 * total)
+        seen = 0
+        for bucket in sorted(self.latency_hist):
+            seen += self.latency_hist[bucket]
+            if seen >= target:
+                return LATENCY_BUCKET ** (bucket + 0.5)
+        return 0.0
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sums": self.sums.tolist(),
+            "boot_weights": self.boot_weights.tolist(),
+            "boot_sums": self.boot_sums.tolist(),
+            "latency_sum": self.latency_sum,
+            "latency_hist": {str(b): c for b, c in self.latency_hist.items()},
+        }
+
+    def load(self, state: Dict[str, Any]) -> None:
+        self.count = state["count"]
+        self.sums = np.array(state["sums"])
+        self.boot_weights = np.array(state["boot_weights"])
+        self.boot_sums = np.array(state["boot_sums"]).reshape(self.boot_sums.shape)
+        self.latency_sum = state["latency_sum"]
+        self.latency_hist = {int(b): c for b, c in state["latency_hist"].items()}
+
+
+def _write_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def evaluate_rag_stream(
+    queries_path: str,
+    gold_path: str,
+    results_path: str,
+    ks: List[int],
+    strategy: str = "bm25",
+    bootstrap: int = 1000,
+    seed: int = 0,
+    batch_size: int = 500,
+    restart: bool = False,
+    context_budget: int = None
+) -> Dict[str, Any]:
+    """Streaming, resumable evaluation; per-query results go to results_path (JSONL)."""
+    ks = sorted(set(ks))
+    max_k = max(ks)
+    names = list(rank_metrics(np.zeros((0, max_k), dtype=bool), np.zeros(0, dtype=np.int64), ks))
+    agg = StreamingAggregate(names, bootstrap)
+
+    checkpoint_path = results_path + ".ckpt"
+    params = {"queries": os.path.abspath(queries_path), "queries_stamp": _file_stamp(queries_path),
+              "gold_stamp": _file_stamp(gold_path), "strategy": strategy, "ks": ks,
+              "bootstrap": bootstrap, "seed": seed, "batch_size": batch_size,
+              "context_budget": context_budget}
+    done, offset = 0, 0
+    context_totals: Dict[str, int] = {}
+    if not restart and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            ckpt = json.load(f)
+        if ckpt.get("params") == params:
+            done, offset = ckpt["done"], ckpt["results_offset"]
+            agg.load(ckpt["aggregate"])
+            context_totals = ckpt.get("context", {})
+            print(f"↩️  Resuming after {done} queries ({agg.count} scored)")
+        else:
+            print("⚠️  Checkpoint does not match these inputs/options; starting over")
+
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    gold_conn = open_gold_index(gold_path, results_path + ".gold.sqlite")
+    mode = "r+b" if offset and os.path.exists(results_path) else "wb"
+    with open(results_path, mode) as out:
+        out.seek(offset)
+        out.truncate()  # drop rows written after the last checkpoint
+        queries = itertools.islice(iter_jsonl(queries_path), done, None)
+        while True:
+            batch = list(itertools.islice(queries, batch_size))
+            if not batch:
+                break
+            items = [(q.get("id", q.get("query", "")), q.get("query", q.get("text", ""))) for q in batch]
+            items = [(str(qid), text) for qid, text in items if text]
+            gold_data = lookup_gold(gold_conn, [qid for qid, _ in items])
+
+            retrieved_lists, gold_lists, latencies = [], [], []
+            for qid, text in items:
+                t0 = time.perf_counter()
+                retrieved, context_stats = retrieve(strategy, text, max_k, context_budget)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                retrieved_lists.append(retrieved)
+                for name, value in (context_stats or {}).items():
+                    context_totals[name] = context_totals.get(name, 0) + value
+                gold_lists.append(gold_data.get(qid, []))
+
+            if items:
+                rel, n_rel = relevance_matrix(retrieved_lists, gold_lists, max_k)
+                per_query = rank_metrics(rel, n_rel, ks)
+                agg.add(per_query, latencies, np.random.default_rng([seed, done]))
+                for i, (qid, text) in enumerate(items):
+                    out.write((json.dumps({
+                        "query_id": qid,
+                        "query": text,
+                        "retrieved_count": len(retrieved_lists[i]),
+                        "gold_count": len(gold_lists[i]),
+                        "recall@k": round(float(per_query[f"recall@{max_k}"][i]), 4),
+                        "mrr": round(float(per_query["mrr"][i]), 4),
+                        "latency_ms": round(latencies[i], 2)
+                    }) + "\n").encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+
+            done += len(batch)
+            _write_checkpoint(checkpoint_path, {"params": params, "done": done,
+                                                "results_offset": out.tell(), "aggregate": agg.state(),
+                                                "context": context_totals})
+            print(f"   … {done} queries processed")
+    gold_conn.close()
+
+    metrics = agg.metrics()
+    out = {
+        "strategy": strategy,
+        "k": max_k,
+        "ks": ks,
+        "num_queries": agg.count,
+        "avg_recall@k": metrics.get(f"recall@{max_k}", 0.0),
+        "avg_mrr": metrics.get("mrr", 0.0),
+        "metrics": metrics,
+        "ci95": agg.ci95(),
+        "latency_ms": {
+            "mean": round(agg.latency_sum / agg.count, 2) if agg.count else 0.0,
+            "p50": round(agg.latency_percentile(50), 2),
+            "p95": round(agg.latency_percentile(95), 2)
+        },
+        "per_query_file": results_path
+    }
+    if context_budget:
+        out["context"] = context_summary(context_totals, agg.count, context_budget)
+    return out
 
 
 def main():
+    global QUANT_MODE
     parser = argparse.ArgumentParser(description="RAG Evaluation - Recall@K and MRR")
     parser.add_argument("--q", required=True, help="Path to queries JSONL file")
     parser.add_argument("--gold", required=True, help="Path to gold standard JSONL file")
-    parser.add_argument("--k", type=int, default=50, help="K for Recall@K (default: 50)")
+    parser.add_argument("--k", type=int, nargs="+", default=[50],
+                        help="one or more K values, e.g. --k 1 5 10 20 50 (default: 50); "
+                             "retrieval runs once at the largest")
+    parser.add_argument("--bootstrap", type=int, default=1000,
+                        help="bootstrap resamples for 95%% CIs (0 disables, default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="bootstrap RNG seed (default: 0)")
     parser.add_argument("--strategy", choices=["bm25", "vector", "hybrid"], default="bm25",
                        help="Retrieval strategy (default: bm25)")
     parser.add_argument("--out", required=True, help="Output JSON file path")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=QUANT_MODE,
+                        help="embedding storage mode to query for vector/hybrid (default: $EMB_QUANT or float)")
+    parser.add_argument("--context-budget", type=int, metavar="TOKENS",
+                        help="also assemble each query's hits into a token budget and report tokens saved")
+    parser.add_argument("--compare-quant", metavar="MODES",
+                        help="also report vector size/latency/recall for each mode, e.g. float,int8,binary")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream queries, write per-query results incrementally and resume from a checkpoint")
+    parser.add_argument("--results", help="per-query JSONL for --stream (default: <out>.queries.jsonl)")
+    parser.add_argument("--batch", type=int, default=500, help="queries per checkpoint in --stream mode (default: 500)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing --stream checkpoint")
 
     args = parser.parse_args()
-
-    # Load data
-    print(f"📊 Loading queries from {args.q}...")
-    queries = load_jsonl(args.q)
-
-    print(f"📊 Loading gold standard from {args.gold}...")
-    gold_list = load_jsonl(args.gold)
-
-    # Convert gold to dict
-    gold_data = {}
-    for item in gold_list:
-        query_id = item.get("id", item.get("query", ""))
-        gold_data[query_id] = item.get("relevant_docs", item.get("docs", []))
-
-    print(f"🔍 Running evaluation with strategy={args.strategy}, k={args.k}...")
-
-    # Run evaluation
-    eval_results = evaluate_rag(queries, gold_data, k=args.k, strategy=args.strategy)
+    QUANT_MODE = args.quant
+    if args.stream and args.compare_quant:
+        parser.error("--compare-quant is not supported with --stream")
+
+    t_eval = time.perf_counter()
+    if args.stream:
+        results_path = args.results or os.path.splitext(args.out)[0] + ".queries.jsonl"
+        print(f"🔍 Streaming evaluation with strategy={args.strategy}, k={','.join(map(str, sorted(set(args.k))))}...")
+        eval_results = evaluate_rag_stream(args.q, args.gold, results_path, ks=args.k, strategy=args.strategy,
+                                           bootstrap=args.bootstrap, seed=args.seed,
+                                           batch_size=args.batch, restart=args.restart,
+                                           context_budget=args.context_budget)
+    else:
+        # Load data
+        print(f"📊 Loading queries from {args.q}...")
+        queries = load_jsonl(args.q)
+
+        print(f"📊 Loading gold standard from {args.gold}...")
+        gold_list = load_jsonl(args.gold)
+
+        # Convert gold to dict
+        gold_data = {}
+        for item in gold_list:
+            query_id = item.get("id", item.get("query", ""))
+            gold_data[query_id] = item.get("relevant_docs", item.get("docs", []))
+
+        print(f"🔍 Running evaluation with strategy={args.strategy}, k={','.join(map(str, sorted(set(args.k))))}...")
+
+        # Run evaluation
+        eval_results = evaluate_rag(queries, gold_data, k=max(args.k), strategy=args.strategy,
+                                    ks=args.k, bootstrap=args.bootstrap, seed=args.seed,
+                                    context_budget=args.context_budget)
+
+        if args.compare_quant:
+            modes = [m.strip() for m in args.compare_quant.split(",") if m.strip() in QUANT_MODES]
+            eval_results["quantization"] = compare_quantization(queries, gold_data, sorted(set(args.k)), modes)
+
+    telemetry.emit("stage", stage=f"rag.eval.{args.strategy}", items=eval_results["num_queries"],
+                   duration_ms=round((time.perf_counter() - t_eval) * 1000, 3), stream=args.stream)
 
     # Save results
     os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
     with open(args.out, "w", encoding="utf-8") as f:
         json.dump(eval_results, f, indent=2)
 
+    # Append to the metrics history and compare with the rolling baseline
+    prefix = f"rag.{eval_results['strategy']}"
+    values = {f"{prefix}.{name}": value for name, value in eval_results["metrics"].items()}
+    values[f"{prefix}.latency_p50_ms"] = eval_results["latency_ms"]["p50"]
+    values[f"{prefix}.latency_p95_ms"] = eval_results["latency_ms"]["p95"]
+    if "context" in eval_results:
+        values[f"{prefix}.context_tokens_saved_pct"] = eval_results["context"]["tokens_saved_pct"]
+    trends = {}
+    if metrics_store.DB_PATH and eval_results["num_queries"]:
+        try:
+            trends = metrics_store.compare(values)
+            metrics_store.record("eval_rag", values)
+        except Exception as e:
+            print(f"⚠️  Failed to update metrics history: {e}")
+
     # Print summary
     print(f"\n✅ Evaluation complete!")
     print(f"   Strategy: {eval_results['strategy']}")
     print(f"   Queries: {eval_results['num_queries']}")
-    print(f"   Avg Recall@{args.k}: {eval_results['avg_recall@k']:.2%}")
-    print(f"   Avg MRR: {eval_results['avg_mrr']:.4f}")
+    ci = eval_results["ci95"]
+    for name, value in eval_results["metrics"].items():
+        bounds = f"  (95% CI {ci[name][0]:.4f}-{ci[name][1]:.4f})" if name in ci else ""
+        print(f"   {name}: {value:.4f}{bounds}")
+    print(f"   Latency p50/p95: {eval_results['latency_ms']['p50']:.1f}/{eval_results['latency_ms']['p95']:.1f} ms")
+    if "context" in eval_results:
+        c = eval_results["context"]
+        print(f"   Context tokens/query: raw {c['avg_raw_tokens']:.0f} -> merged {c['avg_merged_tokens']:.0f}"
+              f" ({c['tokens_saved_pct']:.1f}% saved) -> packed {c['avg_packed_tokens']:.0f}/{c['budget']}")
+    if "quantization" in eval_results:
+        top_k = max(args.k)
+        print(f"   Quantization (vector search):")
+        for mode, q in eval_results["quantization"].items():
+            size = f"{q['index_bytes'] / 1e6:.1f} MB" if q["index_bytes"] is not None else "size n/a"
+            print(f"     {mode:7} {size:>12}  recall@{top_k} {q['metrics'][f'recall@{top_k}']:.4f}"
+                  f"  p50 {q['latency_ms']['p50']:.1f} ms  p95 {q['latency_ms']['p95']:.1f} ms")
+    for name, t in trends.items():
+        if t["baseline"] is not None:
+            flag = "  ❌ regression" if t["regression"] else ""
+            print(f"   Δ {name}: {t['delta']:+.4f} vs baseline {t['baseline']:.4f}{flag}")
     print(f"   Results saved to: {args.out}")
 
 
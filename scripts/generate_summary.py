@@ -4,14 +4,19 @@
 Generate GitHub Actions Step Summary from test reports.
 Outputs Markdown to stdout for use with $GITHUB_STEP_SUMMARY.
 """
-import json
 import os
 import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+from report_reader import coverage_metrics, mutation_metrics
+import diff_coverage
+import metrics_store
+
 REPORTS_DIR = Path("reports")
 ROOT = Path(".")
+DIFF_BASE = os.environ.get("DIFF_BASE")  # e.g. origin/main...HEAD; enables diff coverage
+MAX_DIFF_FILES = 50
 
 
 def read_junit():
@@ -60,40 +65,14 @@ def read_mutation():
         return None
 
     try:
-        with open(mutation_file) as f:
-            data = json.load(f)
-
-        # Extract mutation metrics
-        files = data.get("files", {})
-        total_mutants = 0
-        killed = 0
-        survived = 0
-        timeout = 0
-        no_coverage = 0
-
-        for file_data in files.values():
-            mutants = file_data.get("mutants", [])
-            total_mutants += len(mutants)
-            for mutant in mutants:
-                status = mutant.get("status", "")
-                if status == "Killed":
-                    killed += 1
-                elif status == "Survived":
-                    survived += 1
-                elif status == "Timeout":
-                    timeout += 1
-                elif status == "NoCoverage":
-                    no_coverage += 1
-
-        score = (killed / total_mutants * 100) if total_mutants > 0 else 0
-
+        metrics = mutation_metrics(str(mutation_file))
         return {
-            "score": score,
-            "total": total_mutants,
-            "killed": killed,
-            "survived": survived,
-            "timeout": timeout,
-            "no_coverage": no_coverage
+            "score": metrics["score"] * 100,
+            "total": metrics["total"],
+            "killed": metrics["killed"],
+            "survived": metrics["survived"],
+            "timeout": metrics["timeout"],
+            "no_coverage": metrics["no_coverage"]
         }
     except Exception as e:
         print(f"<!-- Warning: Failed to parse mutation.json: {e} -->", file=sys.stderr)
@@ -107,22 +86,72 @@ def read_coverage():
         return None
 
     try:
-        tree = ET.parse(coverage_file)
-        root = tree.getroot()
-
-        # Cobertura format: <coverage line-rate="0.85" ...>
-        line_rate = float(root.get("line-rate", 0))
-        branch_rate = float(root.get("branch-rate", 0))
-
+        metrics = coverage_metrics(str(coverage_file))
         return {
-            "line": line_rate * 100,
-            "branch": branch_rate * 100
+            "line": metrics["line_rate"] * 100,
+            "branch": metrics["branch_rate"] * 100
         }
     except Exception as e:
         print(f"<!-- Warning: Failed to parse coverage.xml: {e} -->", file=sys.stderr)
         return None
 
 
+def read_diff_coverage():
+    """Coverage of the lines added since DIFF_BASE."""
+    coverage_file = REPORTS_DIR / "coverage.xml"
+    if not DIFF_BASE or not coverage_file.exists():
+        return None
+
+    try:
+        return diff_coverage.compute(str(coverage_file), DIFF_BASE)
+    except Exception as e:
+        print(f"<!-- Warning: Failed to compute diff coverage: {e} -->", file=sys.stderr)
+        return None
+
+
+def run_metrics(junit, coverage, mutation, diff):
+    """Flat metric values for this run, as stored in the metrics history."""
+    values = {}
+    if junit:
+        values["tests.count"] = junit["tests"]
+        values["tests.duration_s"] = junit["time"]
+    if coverage:
+        values["coverage.line"] = coverage["line"]
+        values["coverage.branch"] = coverage["branch"]
+    if diff and diff["lines"]:
+        values["coverage.diff"] = diff["rate"] * 100
+    if mutation:
+        values["mutation.score"] = mutation["score"]
+    return values
+
+
+def print_trends(values):
+    """Compare against the rolling baseline, then append this run to the history."""
+    if not values or not metrics_store.DB_PATH:
+        return
+    try:
+        trends = metrics_store.compare(values)
+        metrics_store.record("ci", values)
+    except Exception as e:
+        print(f"<!-- Warning: Failed to update metrics history: {e} -->", file=sys.stderr)
+        return
+
+    rows = [(name, t) for name, t in trends.items() if t["baseline"] is not None]
+    if not rows:
+        return
+    print(f"## 📈 Trends (vs median of last {metrics_store.BASELINE_RUNS} runs)")
+    print()
+    print("| Metric | Current | Baseline | Δ | |")
+    print("|--------|---------|----------|---|---|")
+    for name, t in rows:
+        flag = "❌ regression" if t["regression"] else "✅"
+        print(f"| {name} | {t['value']:.2f} | {t['baseline']:.2f} | {t['delta']:+.2f} ({t['rel']*100:+.1f}%) | {flag} |")
+    print()
+    if any(t["regression"] for _, t in rows):
+        print("⚠️ **Regression beyond the noise band detected.**")
+        print()
+
+
 def generate_summary():
     """Generate GitHub-flavored Markdown summary."""
     print("# 🤖 AI Pipeline - Test Results")
@@ -166,6 +195,24 @@ def generate_summary():
         print(f"- **Branch Coverage**: {coverage['branch']:.1f}%")
         print()
 
+    diff = read_diff_coverage()
+    if diff and diff["lines"]:
+        diff_pct = diff["rate"] * 100
+        icon = "🟢" if diff_pct >= 80 else "🟡" if diff_pct >= 60 else "🔴"
+        print(f"## {icon} Diff Coverage")
+        print()
+        print(f"- **New Lines Covered**: {diff['covered']}/{diff['lines']} ({diff_pct:.1f}%)")
+        print()
+        uncovered = [(p, f) for p, f in diff["files"].items() if f["uncovered"]]
+        if uncovered:
+            print("| File | Covered | Uncovered new lines |")
+            print("|------|---------|---------------------|")
+            for path, f in uncovered[:MAX_DIFF_FILES]:
+                print(f"| `{path}` | {f['covered']}/{f['lines']} | {diff_coverage.format_ranges(f['uncovered'])} |")
+            if len(uncovered) > MAX_DIFF_FILES:
+                print(f"| … | | {len(uncovered) - MAX_DIFF_FILES} more files |")
+            print()
+
     # Mutation testing
     mutation = read_mutation()
     if mutation:
@@ -195,6 +242,8 @@ def generate_summary():
             print("❌ **Status**: Below break threshold - improve tests!")
         print()
 
+    print_trends(run_metrics(junit, coverage, mutation, diff))
+
     # Artifacts
     print("## 📦 Artifacts")
     print()
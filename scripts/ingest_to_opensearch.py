@@ -1,29 +1,65 @@
 #!/usr/bin/env python3
 # SPDX-License-Identifier: Apache-2.0
-import os, sys, json, hashlib, subprocess, time
+import time
+_T0 = time.perf_counter()
+import os, sys, json, hashlib, subprocess, argparse
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
-# deps stdlib + requests/tqdm
-try:
-    import requests  # type: ignore
-except Exception:
-    print("ERROR: pip install requests first", file=sys.stderr); sys.exit(1)
-try:
-    from tqdm import tqdm  # type: ignore
-except Exception:
-    def tqdm(x, **k): return x  # no-op
+from quantize import MODES as QUANT_MODES, embedding_fields, index_body, index_name
+from dedup import NearDupIndex, shingles
+import telemetry
+
+_STARTUP: Dict[str, float] = {}  # label -> seconds, reported by --profile-startup
+
+@contextmanager
+def _timed(label: str):
+    t = time.perf_counter()
+    try: yield
+    finally: _STARTUP[label] = _STARTUP.get(label, 0.0) + time.perf_counter() - t
+
+# Heavy deps (requests, tqdm, sentence_transformers/torch) are imported on first
+# use so importing helpers like chunk_lines/detect_lang, --help and dry runs stay cheap.
+def _requests():
+    with _timed("import requests"):
+        try:
+            import requests  # type: ignore
+        except Exception:
+            print("ERROR: pip install requests first", file=sys.stderr); sys.exit(1)
+    return requests
+
+def _tqdm():
+    with _timed("import tqdm"):
+        try:
+            from tqdm import tqdm  # type: ignore
+        except Exception:
+            def tqdm(x, **k): return x  # no-op
+    return tqdm
 
 USE_EMB = os.environ.get("WITH_EMBEDDINGS", "0") in ("1","true","yes")
+EMB_MODEL_NAME = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMB_QUANT = os.environ.get("EMB_QUANT", "float")  # float | int8 | binary (see quantize.py)
+EMB_RESCORE_STORE = os.environ.get("EMB_RESCORE_STORE", "0") in ("1","true","yes")
+_emb_model = None
 
-if USE_EMB:
-    try:
-        from sentence_transformers import SentenceTransformer  # type: ignore
-        EMB_MODEL_NAME = os.environ.get("EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-        _emb_model = SentenceTransformer(EMB_MODEL_NAME)
-        EMB_DIM = len(_emb_model.encode("test"))
-    except Exception as e:
-        print(f"WARNING: embeddings disabled ({e})"); USE_EMB = False; _emb_model = None; EMB_DIM = 0
+def emb_model():
+    """Embedding model, loaded on the first chunk that needs it (None if disabled)."""
+    global _emb_model, USE_EMB
+    if _emb_model is None and USE_EMB:
+        try:
+            with _timed("import sentence_transformers"):
+                from sentence_transformers import SentenceTransformer  # type: ignore
+            with _timed(f"load model {EMB_MODEL_NAME}"):
+                _emb_model = SentenceTransformer(EMB_MODEL_NAME)
+        except Exception as e:
+            print(f"WARNING: embeddings disabled ({e})"); USE_EMB = False; _emb_model = None
+    return _emb_model
+
+def emb_dim() -> int:
+    """Embedding dimension from the model config (no dummy encode)."""
+    m = emb_model()
+    return m.get_sentence_embedding_dimension() if m else 0
 
 ROOT = Path(os.environ.get("ROOT", "/workspace")).resolve()
 OS_URL = os.environ.get("OS_URL", "https://localhost:9200").rstrip("/")
@@ -37,11 +73,20 @@ INCLUDE_GLOBS = [
 ]
 EXCLUDE_DIRS = {".git", "node_modules", ".venv", "venv", "dist", "build", ".stryker-tmp"}
 
+DEDUP = os.environ.get("DEDUP", "1") in ("1","true","yes")
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.9"))  # estimated Jaccard similarity
+VENDOR_DIRS = {"vendor", "vendors", "third_party", "third-party", "external", "deps", "_vendor"}
+
+def canonical_rank(fp: Path):
+    """Dedup keeps the first copy it sees: visit first-party, shallow, short paths first."""
+    rel = fp.relative_to(ROOT)
+    return (any(p.lower() in VENDOR_DIRS for p in rel.parts[:-1]), len(rel.parts), len(str(rel)), str(rel))
+
 WINDOW = int(os.environ.get("CHUNK_LINES", "80"))
 OVERLP = int(os.environ.get("CHUNK_OVERLAP", "20"))
 
 def git(cmd: List[str]) -> str:
-    return subprocess.check_output(cmd, cwd=ROOT).decode().strip()
+    return subprocess.check_output(cmd, cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
 
 def repo_sha() -> str:
     try: return git(["git", "rev-parse", "HEAD"])
@@ -58,11 +103,22 @@ def detect_lang(path: Path) -> str:
     return {"js":"javascript","ts":"typescript","py":"python","java":"java","go":"go",
             "cs":"csharp","rb":"ruby","php":"php","rs":"rust"}.get(ext, ext or "text")
 
-def iter_files() -> List[Path]:
+def expand_braces(pattern: str) -> List[str]:
+    """'**/*.{js,ts}' -> ['**/*.js', '**/*.ts'] (pathlib.glob has no brace support)."""
+    a = pattern.find("{"); b = pattern.find("}", a)
+    if a < 0 or b < 0: return [pattern]
+    head, tail = pattern[:a], pattern[b+1:]
+    return [x for alt in pattern[a+1:b].split(",") for x in expand_braces(head + alt + tail)]
+
+def iter_files(root: Optional[Path] = None, globs: Optional[List[str]] = None,
+               exclude: Optional[set] = None) -> List[Path]:
+    root = root or ROOT
+    globs = globs or INCLUDE_GLOBS
+    exclude = EXCLUDE_DIRS if exclude is None else exclude
     files: List[Path] = []
-    for pat in INCLUDE_GLOBS:
-        for p in ROOT.glob(pat):
-            if p.is_file() and not any(part in EXCLUDE_DIRS for part in p.parts):
+    for pat in globs:
+        for p in root.glob(pat):
+            if p.is_file() and not any(part in exclude for part in p.relative_to(root).parts):
                 files.append(p)
     # de-dup
     uniq = []
@@ -89,25 +145,86 @@ def chunk_lines(lines: List[str], window: int, overlap: int) -> List[Tuple[int,i
 def bulk_post(actions: List[Dict]):
     if not actions: return
     ndjson = "\n".join(json.dumps(a, ensure_ascii=False) for a in actions) + "\n"
-    r = requests.post(f"{OS_URL}/_bulk", data=ndjson.encode("utf-8"),
+    r = _requests().post(f"{OS_URL}/_bulk", data=ndjson.encode("utf-8"),
                       headers={"Content-Type":"application/x-ndjson"},
                       verify=False, auth=(OS_USER, OS_PASS), timeout=60)
     r.raise_for_status()
     resp = r.json()
     if resp.get("errors"):
-        errs = [it for it in resp.get("items", []) if it.get("index",{}).get("error")]
+        errs = [it for it in resp.get("items", []) if any(v.get("error") for v in it.values())]
         print(json.dumps(errs[:3], indent=2, ensure_ascii=False), file=sys.stderr)
         raise RuntimeError("bulk had errors")
 
+def ensure_index(index: str, mode: str, dim: int, store_f32: bool = False):
+    """Create the index with a knn mapping for `mode` unless it already exists."""
+    rq = _requests()
+    auth = (OS_USER, OS_PASS)
+    if rq.head(f"{OS_URL}/{index}", verify=False, auth=auth, timeout=30).status_code == 200:
+        return
+    r = rq.put(f"{OS_URL}/{index}", json=index_body(mode, dim, store_f32), verify=False, auth=auth, timeout=60)
+    r.raise_for_status()
+    print(f"created index {index} ({mode}, dim={dim})")
+
+def print_startup_profile():
+    print("startup profile (seconds):", file=sys.stderr)
+    for label, dt in sorted(_STARTUP.items(), key=lambda kv: -kv[1]):
+        print(f"  {dt:8.3f}  {label}", file=sys.stderr)
+
 def main():
+    global ROOT
+    _STARTUP["module import"] = _T0_DONE - _T0
+    ap = argparse.ArgumentParser(description="Chunk a source tree and bulk-index it into OpenSearch")
+    ap.add_argument("root", nargs="?", help="tree to ingest (default: $ROOT or /workspace)")
+    ap.add_argument("--dir", help="same as the positional root")
+    ap.add_argument("--pattern", action="append",
+                    help="glob to include, braces allowed (repeatable; default: built-in list)")
+    ap.add_argument("--exclude", help="comma-separated directory names to skip, added to the defaults")
+    ap.add_argument("--dry-run", action="store_true", help="chunk files but do not embed or post")
+    ap.add_argument("--quant", choices=QUANT_MODES, default=EMB_QUANT,
+                    help="embedding storage: float, int8 or binary; "
+                         "non-float modes use index <INDEX>-<mode>")
+    ap.add_argument("--rescore-store", action="store_true", default=EMB_RESCORE_STORE,
+                    help="with int8/binary, also store a float32 copy so eval_rag can rescore "
+                         "(default: $EMB_RESCORE_STORE or off)")
+    ap.add_argument("--no-dedup", dest="dedup", action="store_false", default=DEDUP,
+                    help="index near-duplicate chunks separately (default: keep one canonical copy)")
+    ap.add_argument("--profile-startup", action="store_true",
+                    help="report import/model-load time on stderr at exit")
+    args = ap.parse_args()
+
+    if args.dir or args.root:
+        ROOT = Path(args.dir or args.root).resolve()
+    globs = [g for pat in args.pattern for g in expand_braces(pat)] if args.pattern else None
+    exclude = EXCLUDE_DIRS | {d.strip() for d in args.exclude.split(",") if d.strip()} if args.exclude else None
+    try:
+        ingest(iter_files(ROOT, globs, exclude), dry_run=args.dry_run, quant=args.quant, dedup=args.dedup,
+               rescore_store=args.rescore_store)
+    finally:
+        if args.profile_startup: print_startup_profile()
+
+def ingest(files: List[Path], dry_run: bool = False, quant: str = "float", dedup: bool = True,
+           rescore_store: bool = False, post=None) -> Dict:
+    """Chunk, dedup, embed and index files; returns ingest stats."""
     sha_repo = repo_sha()
-    files = iter_files()
-    print(f"repo={sha_repo} files={len(files)} root={ROOT}")
+    index = index_name(INDEX, quant) if USE_EMB else INDEX
+    index_ready = dry_run
+    print(f"repo={sha_repo} files={len(files)} root={ROOT} index={index}")
     t0 = time.time()
     batch = []
     total = 0
+    if post is None:
+        post = (lambda actions: None) if dry_run else bulk_post
+    send = post
+    def post(actions):
+        with telemetry.span("ingest.bulk", items=len(actions)//2):
+            send(actions)
+    near_dups = NearDupIndex(DEDUP_THRESHOLD) if dedup else None
+    if near_dups is not None:
+        files = sorted(files, key=canonical_rank)  # deterministic canonical copy, independent of glob order
+    alternates: Dict[str, List[str]] = {}  # canonical uid -> doc_ids of dropped near-duplicates
+    dropped = 0
 
-    for fp in tqdm(files, desc="ingesting"):
+    for fp in _tqdm()(files, desc="ingesting"):
         try:
             txt = fp.read_text(encoding="utf-8", errors="ignore")
         except Exception:
@@ -116,9 +233,17 @@ def main():
         chunks = chunk_lines(lines, WINDOW, OVERLP)
         lang = detect_lang(fp)
         sha_blob = file_blob_sha(fp)
+        path_str = str(fp.relative_to(ROOT)).replace("\\","/")
         for (start, end, content) in chunks:
-            path_str = str(fp.relative_to(ROOT)).replace("\\","/")
             doc_id = f"{path_str}:{start}"
+            # id estável = hash(repo_sha + path + start_line + sha_blob)
+            uid = hashlib.sha1(f"{sha_repo}|{path_str}|{start}|{sha_blob}".encode()).hexdigest()
+            if near_dups is not None:
+                canonical = near_dups.find_or_add(uid, shingles(content), group=path_str)
+                if canonical is not None:
+                    alternates.setdefault(canonical, []).append(doc_id)
+                    dropped += 1
+                    continue
             doc = {
                 "doc_id": doc_id,
                 "repo_sha": sha_repo,
@@ -131,18 +256,38 @@ def main():
                 "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
                 "content": content
             }
-            if USE_EMB and _emb_model:
-                vec = _emb_model.encode(content, normalize_embeddings=True).tolist()
-                doc["embedding"] = vec
-            # id estável = hash(repo_sha + path + start_line + sha_blob)
-            uid = hashlib.sha1(f"{sha_repo}|{doc['path']}|{start}|{sha_blob}".encode()).hexdigest()
-            meta = {"index": {"_index": INDEX, "_id": uid}}
+            model = emb_model() if USE_EMB and not dry_run else None
+            if model is not None:
+                if "time to first embedding" not in _STARTUP:
+                    _STARTUP["time to first embedding"] = time.perf_counter() - _T0
+                if not index_ready:
+                    ensure_index(index, quant, emb_dim(), rescore_store); index_ready = True
+                with telemetry.span("ingest.embed", items=1):
+                    vec = model.encode(content, normalize_embeddings=True).tolist()
+                doc.update(embedding_fields(vec, quant, rescore_store))
+            meta = {"index": {"_index": index, "_id": uid}}
             batch.append(meta); batch.append(doc)
             if len(batch) >= 1000*2:  # 1000 docs por bulk
-                bulk_post(batch); total += 500; batch = []
-    if batch: bulk_post(batch); total += len(batch)//2
+                post(batch); total += len(batch)//2; batch = []
+    if batch: post(batch); total += len(batch)//2
+    # record dropped copies on their canonical chunk
+    updates = []
+    for uid, doc_ids in alternates.items():
+        updates.append({"update": {"_index": index, "_id": uid}}); updates.append({"doc": {"alt_doc_ids": doc_ids}})
+        if len(updates) >= 1000*2:
+            post(updates); updates = []
+    if updates: post(updates)
     dt = time.time() - t0
+    telemetry.emit("stage", stage="ingest", duration_ms=round(dt*1000, 3), items=total, files=len(files),
+                   duplicates_dropped=dropped, dry_run=dry_run)
     print(f"done: {total} chunks in {dt:.1f}s (avg {total/max(dt,1):.1f} docs/s)")
+    if dedup:
+        print(f"dedup: dropped {dropped} near-duplicate chunks "
+              f"({dropped/max(total+dropped,1)*100:.1f}%) onto {len(alternates)} canonical chunks")
+    return {"files": len(files), "chunks": total, "duplicates_dropped": dropped,
+            "canonical_with_duplicates": len(alternates), "seconds": dt}
+
+_T0_DONE = time.perf_counter()
 
 if __name__ == "__main__":
     main()
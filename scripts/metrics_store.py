@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Append-only metrics history for CI runs (SQLite, stdlib only).
+
+Each run appends one row per metric with commit sha and timestamp.
+Readers compare a run against a rolling baseline (median of the previous
+BASELINE_RUNS values) and flag moves beyond a per-metric noise band.
+
+Usage:
+  python scripts/metrics_store.py list
+  python scripts/metrics_store.py history tests.duration_s --last 20
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from fnmatch import fnmatch
+
+DB_PATH = os.environ.get("METRICS_DB", ".ai/metrics.db")
+BASELINE_RUNS = int(os.environ.get("METRICS_BASELINE_RUNS", "10"))
+
+# (pattern, better direction, relative noise band); first match wins
+BANDS = [
+    ("*duration*", "lower", 0.20),
+    ("*latency*", "lower", 0.20),
+    ("coverage.*", "higher", 0.02),
+    ("*", "higher", 0.05),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    ts REAL NOT NULL,
+    sha TEXT,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_name_ts ON metrics (name, ts);
+"""
+
+
+def connect(db=None):
+    db = db or DB_PATH
+    os.makedirs(os.path.dirname(db) or ".", exist_ok=True)
+    conn = sqlite3.connect(db)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def current_sha():
+    sha = os.environ.get("GITHUB_SHA")
+    if sha:
+        return sha
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def record(source, values, sha=None, ts=None, db=None):
+    """Append one run's metrics ({name: number}) to the store."""
+    ts = time.time() if ts is None else ts
+    sha = sha or current_sha()
+    rows = [(ts, sha, source, name, float(v)) for name, v in values.items() if v is not None]
+    with connect(db) as conn:
+        conn.executemany("INSERT INTO metrics (ts, sha, source, name, value) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.close()
+
+
+def history(name, last=BASELINE_RUNS, before=None, db=None):
+    """Most recent (ts, sha, value) rows for a metric, newest first."""
+    before = time.time() + 1 if before is None else before
+    conn = connect(db)
+    try:
+        return conn.execute(
+            "SELECT ts, sha, value FROM metrics WHERE name = ? AND ts < ? ORDER BY ts DESC LIMIT ?",
+            (name, before, last),
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def band_for(name):
+    for pattern, direction, band in BANDS:
+        if fnmatch(name, pattern):
+            return direction, band
+    return "higher", 0.05
+
+
+def compare(values, window=BASELINE_RUNS, db=None):
+    """Delta of each metric against the median of its previous `window` values.
+
+    Call before record() so the current run is not part of its own baseline.
+    """
+    out = {}
+    for name, value in values.items():
+        if value is None:
+            continue
+        rows = history(name, last=window, db=db)
+        if not rows:
+            out[name] = {"value": value, "baseline": None, "delta": None, "regression": False, "runs": 0}
+            continue
+        baseline = statistics.median(r[2] for r in rows)
+        delta = value - baseline
+        rel = delta / abs(baseline) if baseline else 0.0
+        direction, band = band_for(name)
+        regression = rel > band if direction == "lower" else rel < -band
+        out[name] = {"value": value, "baseline": baseline, "delta": delta, "rel": rel,
+                     "regression": regression, "runs": len(rows)}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the CI metrics history")
+    ap.add_argument("--db", default=DB_PATH)
+    sub = ap.add_subparsers(dest="cmd")
+    sub.add_parser("list")
+    h = sub.add_parser("history")
+    h.add_argument("name")
+    h.add_argument("--last", type=int, default=20)
+    args = ap.parse_args()
+
+    if args.cmd == "list":
+        conn = connect(args.db)
+        for name, n, last in conn.execute(
+                "SELECT name, COUNT(*), MAX(ts) FROM metrics GROUP BY name ORDER BY name"):
+            print(f"{name:40} {n:6} runs  last {time.strftime('%Y-%m-%d %H:%M', time.gmtime(last))}")
+        conn.close()
+        return 0
+    if args.cmd == "history":
+        for ts, sha, value in history(args.name, last=args.last, db=args.db):
+            print(f"{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))}  {(sha or '-')[:10]:10}  {value:.4f}")
+        return 0
+    ap.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Embedding quantization shared by ingestion and evaluation (stdlib only).
+
+Modes:
+  float   float32 knn_vector (JSON floats), no rescoring
+  int8    scalar-quantized to int8 (v * 127, embeddings are L2-normalized);
+          OpenSearch `data_type: byte`, Lucene HNSW
+  binary  sign bit per dimension packed 8 per byte; OpenSearch
+          `data_type: binary` (Faiss, Hamming; needs OpenSearch >= 2.16)
+
+With `store_f32` (ingest --rescore-store), quantized modes also keep the
+full-precision vector as base64 float32 in a non-indexed `embedding_f32`
+binary field, so the top candidates can be rescored exactly. It is off by
+default because it costs more payload and _source than the quantized vector
+saves. Queries are quantized the same way as documents.
+"""
+import base64
+import math
+import struct
+from typing import Dict, List, Sequence
+
+MODES = ("float", "int8", "binary")
+INT8_SCALE = 127.0
+
+
+def index_name(base: str, mode: str) -> str:
+    """One index per mode, so all of them can be compared side by side."""
+    return base if mode == "float" else f"{base}-{mode}"
+
+
+def quantize_int8(vec: Sequence[float]) -> List[int]:
+    return [max(-128, min(127, int(round(v * INT8_SCALE)))) for v in vec]
+
+
+def binarize(vec: Sequence[float]) -> List[int]:
+    """Pack sign bits MSB-first into signed bytes (OpenSearch binary vector format)."""
+    out = []
+    for i in range(0, len(vec), 8):
+        byte = 0
+        for j, v in enumerate(vec[i:i + 8]):
+            if v > 0:
+                byte |= 0x80 >> j
+        out.append(byte - 256 if byte > 127 else byte)
+    return out
+
+
+def quantize(vec: Sequence[float], mode: str) -> List:
+    if mode == "int8":
+        return quantize_int8(vec)
+    if mode == "binary":
+        return binarize(vec)
+    return [float(v) for v in vec]
+
+
+def pack_f32(vec: Sequence[float]) -> str:
+    return base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode("ascii")
+
+
+def unpack_f32(data: str) -> List[float]:
+    raw = base64.b64decode(data)
+    return list(struct.unpack(f"<{len(raw) // 4}f", raw))
+
+
+def vector_field(mode: str, dim: int) -> Dict:
+    if mode == "int8":
+        return {"type": "knn_vector", "dimension": dim, "data_type": "byte",
+                "method": {"name": "hnsw", "space_type": "cosinesimil", "engine": "lucene"}}
+    if mode == "binary":
+        return {"type": "knn_vector", "dimension": int(math.ceil(dim / 8)) * 8, "data_type": "binary",
+                "method": {"name": "hnsw", "space_type": "hamming", "engine": "faiss"}}
+    return {"type": "knn_vector", "dimension": dim,
+            "method": {"name": "hnsw", "space_type": "cosinesimil", "engine": "lucene"}}
+
+
+def index_body(mode: str, dim: int, store_f32: bool = False) -> Dict:
+    """Index settings + mapping for chunk documents with embeddings in `mode`."""
+    props = {"embedding": vector_field(mode, dim)}
+    if store_f32 and mode != "float":
+        props["embedding_f32"] = {"type": "binary"}
+    return {"settings": {"index": {"knn": True}}, "mappings": {"properties": props}}
+
+
+def embedding_fields(vec: Sequence[float], mode: str, store_f32: bool = False) -> Dict:
+    """Document fields for one chunk embedding (+ `embedding_f32` for rescoring if `store_f32`)."""
+    doc = {"embedding": quantize(vec, mode)}
+    if store_f32 and mode != "float":
+        doc["embedding_f32"] = pack_f32(vec)
+    return doc
+
+
+def rescore(query_vec: Sequence[float], hits: List[Dict]) -> List[Dict]:
+    """Re-rank hits carrying `_source.embedding_f32` by exact dot product with the query."""
+    def score(hit):
+        data = hit.get("_source", {}).get("embedding_f32")
+        if not data:
+            return float("-inf")
+        return sum(a * b for a, b in zip(query_vec, unpack_f32(data)))
+    return sorted(hits, key=score, reverse=True)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Shared, bounded-memory readers for coverage and mutation reports.
+
+Cobertura XML is stream-parsed with iterparse (elements are cleared as they
+are consumed) and Stryker mutation.json is scanned for mutant statuses
+without materializing the embedded file sources. Parsed metrics are cached
+in a small sidecar file (<report>.metrics.json) keyed by the report's size
+and mtime, so the second consumer in a pipeline reads them instantly.
+"""
+import base64
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+SIDECAR_SUFFIX = ".metrics.json"
+CHUNK_SIZE = 1 << 20
+
+# A structural `"status": "Killed"` pair. Quotes inside JSON strings are
+# always escaped, so embedded source code can never produce a match.
+_STATUS_RE = re.compile(rb'"status"\s*:\s*"([A-Za-z]+)"')
+_STATUS_TAIL = 64  # longest partial match that can straddle a chunk boundary
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cached(path, kind, compute):
+    """Return compute(path), reusing the sidecar cache when the report is unchanged."""
+    sidecar = path + SIDECAR_SUFFIX
+    stamp = _stamp(path)
+    try:
+        with open(sidecar, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("stamp") == stamp and kind in data:
+            return data[kind]
+    except (OSError, ValueError):
+        data = {}
+    if data.get("stamp") != stamp:
+        data = {"stamp": stamp}
+    data[kind] = compute(path)
+    try:
+        tmp = sidecar + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass  # read-only reports dir: still return the metrics
+    return data[kind]
+
+
+def _parse_coverage(path):
+    line_rate = branch_rate = None
+    lines_valid = lines_covered = 0
+    root = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if root is None:
+            root = elem
+            line_rate = elem.attrib.get("line-rate")
+            branch_rate = elem.attrib.get("branch-rate")
+            if line_rate is not None:
+                break  # root totals are all we need; skip the rest of the file
+            continue
+        if event == "end" and elem.tag == "class":
+            lv = elem.attrib.get("lines-valid") or elem.attrib.get("linesValid")
+            lc = elem.attrib.get("lines-covered") or elem.attrib.get("linesCovered")
+            if lv and lc:
+                lines_valid += int(float(lv))
+                lines_covered += int(float(lc))
+            elem.clear()
+    if line_rate is not None:
+        line = float(line_rate)
+    else:
+        line = (lines_covered / lines_valid) if lines_valid else 0.0
+    return {"line_rate": line, "branch_rate": float(branch_rate or 0)}
+
+
+def coverage_metrics(path):
+    """Line and branch rate (0..1) from a Cobertura XML report."""
+    return cached(path, "coverage", _parse_coverage)
+
+
+def _set_bit(bits, n):
+    idx = n >> 3
+    if idx >= len(bits):
+        bits.extend(bytes(idx + 1 - len(bits)))
+    bits[idx] |= 1 << (n & 7)
+
+
+def has_bit(bits, n):
+    idx = n >> 3
+    return idx < len(bits) and bool(bits[idx] >> (n & 7) & 1)
+
+
+def _build_line_index(path):
+    sources, files = [], {}
+    for event, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "source":
+            if elem.text:
+                sources.append(elem.text.strip())
+        elif elem.tag == "class":
+            name = elem.attrib.get("filename")
+            lines = elem.find("lines")  # direct child only; <methods> repeat the same lines
+            if name and lines is not None:
+                valid, covered = files.setdefault(name, (bytearray(), bytearray()))
+                for line in lines:
+                    n = int(line.get("number", 0))
+                    _set_bit(valid, n)
+                    if int(float(line.get("hits", 0))) > 0:
+                        _set_bit(covered, n)
+            elem.clear()
+        elif elem.tag in ("classes", "package"):
+            elem.clear()
+    return {
+        "sources": sources,
+        "files": {name: [base64.b64encode(v).decode("ascii"), base64.b64encode(c).decode("ascii")]
+                  for name, (v, c) in files.items()},
+    }
+
+
+def coverage_line_index(path):
+    """Per-file (valid, covered) line bitsets from a Cobertura XML report.
+
+    Returns {"sources": [...], "files": {filename: (valid, covered)}} where both
+    bitsets are bytearrays indexed by line number (see has_bit).
+    """
+    data = cached(path, "lines", _build_line_index)
+    return {
+        "sources": data["sources"],
+        "files": {name: (bytearray(base64.b64decode(v)), bytearray(base64.b64decode(c)))
+                  for name, (v, c) in data["files"].items()},
+    }
+
+
+def iter_mutant_statuses(path, chunk_size=CHUNK_SIZE):
+    """Yield the status of every mutant in a Stryker mutation.json, streaming."""
+    buf = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buf += chunk
+            last = 0
+            for m in _STATUS_RE.finditer(buf):
+                yield m.group(1).decode("ascii")
+                last = m.end()
+            if not chunk:
+                return
+            buf = buf[max(last, len(buf) - _STATUS_TAIL):]
+
+
+def _count_mutants(path):
+    counts = {}
+    for status in iter_mutant_statuses(path):
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def mutation_metrics(path):
+    """Mutant counts by status plus total/killed/score from a Stryker mutation.json."""
+    counts = cached(path, "mutation", _count_mutants)
+    total = sum(counts.values())
+    killed = counts.get("Killed", 0)
+    return {
+        "total": total,
+        "killed": killed,
+        "survived": counts.get("Survived", 0),
+        "timeout": counts.get("Timeout", 0),
+        "no_coverage": counts.get("NoCoverage", 0),
+        "score": (killed / total) if total else 0.0,
+        "by_status": counts,
+    }
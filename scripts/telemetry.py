@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: Apache-2.0
+"""
+Structured telemetry events and rolling daily aggregates (stdlib only).
+
+Entry points call emit() / span(); events are buffered in memory and written
+by a background thread (and at exit) to daily-rotated JSONL files,
+`.ai/logs/events-YYYY-MM-DD.jsonl`, so emitting never blocks on disk. `.ai/`
+already holds the ai_cli socket and metrics.db, so running ai_cli inside a
+project adds no new top-level directory.
+
+The aggregator reads only the bytes appended since its last run (per-file
+offsets kept in `.ai/logs/rollup.json`) and folds them into per-day, per-stage
+rollups: counts, items, errors, cache hits/misses and a log-bucket duration
+histogram, so p50/p95 can be merged across days without the raw events.
+
+Usage:
+  python scripts/telemetry.py report --days 7
+  python scripts/telemetry.py report --stage rag. --json
+  python scripts/telemetry.py update
+"""
+import argparse
+import atexit
+import glob
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+LOG_DIR = os.environ.get("TELEMETRY_DIR", os.path.join(".ai", "logs"))
+ENABLED = os.environ.get("TELEMETRY", "1").lower() not in ("0", "false", "no")
+FLUSH_SECS = float(os.environ.get("TELEMETRY_FLUSH_SECS", "1.0"))
+FLUSH_EVENTS = 256      # wake the writer early once this many events are pending
+MAX_PENDING = 100_000   # beyond this, new events are dropped (and counted) rather than grow memory
+BUCKET_BASE = 1.1       # histogram resolution: ~5% relative error on percentiles
+
+# event type -> required fields; every event also gets ts, event and pid
+EVENTS = {
+    "stage": ("stage", "duration_ms"),                      # optional: items, ok
+    "cache": ("stage", "hit"),
+    "rag_query": ("stage", "duration_ms", "k", "max_score"),
+}
+
+_pending: List[tuple] = []
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # held for a whole flush, so the exit flush waits for the writer's batch
+_wake = threading.Event()
+_writer: Optional[threading.Thread] = None
+_dropped = 0
+
+
+def emit(event: str, **fields: Any) -> None:
+    """Queue one event; serialization and the file write happen on the writer thread."""
+    global _dropped
+    if not ENABLED:
+        return
+    required = EVENTS.get(event)
+    if required is None:
+        raise ValueError(f"unknown telemetry event: {event}")
+    missing = [f for f in required if f not in fields]
+    if missing:
+        raise ValueError(f"{event} event missing fields: {', '.join(missing)}")
+    with _lock:
+        if len(_pending) >= MAX_PENDING:
+            _dropped += 1
+            return
+        _pending.append((time.time(), event, fields))
+        n = len(_pending)
+    if _writer is None:
+        _start_writer()
+    if n >= FLUSH_EVENTS:
+        _wake.set()
+
+
+@contextmanager
+def span(stage: str, **fields: Any):
+    """Time a block and emit a `stage` event.
+
+    The yielded dict can carry extra fields (e.g. items, or ok=False for a failed run);
+    an exception always marks the stage as failed.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield fields
+    except BaseException:
+        fields["ok"] = False
+        raise
+    finally:
+        fields.setdefault("ok", True)
+        emit("stage", stage=stage, duration_ms=round((time.perf_counter() - t0) * 1000, 3), **fields)
+
+
+def log_path(day: str, log_dir: str = None) -> str:
+    return os.path.join(log_dir or LOG_DIR, f"events-{day}.jsonl")
+
+
+def flush() -> None:
+    """Write all pending events, one append per daily file."""
+    with _flush_lock:
+        _flush()
+
+
+def _flush() -> None:
+    global _pending, _dropped
+    with _lock:
+        batch, _pending = _pending, []
+        dropped, _dropped = _dropped, 0
+    if dropped:
+        batch.append((time.time(), "stage", {"stage": "telemetry.dropped", "duration_ms": 0, "items": dropped}))
+    if not batch:
+        return
+    pid = os.getpid()
+    by_day: Dict[str, List[str]] = {}
+    for ts, event, fields in batch:
+        day = time.strftime("%Y-%m-%d", time.gmtime(ts))
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + f".{int(ts % 1 * 1000):03d}Z"
+        record = {"ts": stamp, "event": event, "pid": pid, **fields}
+        by_day.setdefault(day, []).append(json.dumps(record, default=str, separators=(",", ":")))
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        for day, lines in by_day.items():
+            # one O_APPEND write per file keeps lines from concurrent processes whole
+            fd = os.open(log_path(day), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, ("\n".join(lines) + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+    except OSError as e:
+        print(f"telemetry: write failed: {e}", file=sys.stderr)
+
+
+def _writer_loop() -> None:
+    while True:
+        _wake.wait(FLUSH_SECS)
+        _wake.clear()
+        flush()
+
+
+def _start_writer() -> None:
+    global _writer
+    with _lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(target=_writer_loop, name="telemetry-writer", daemon=True)
+        _writer.start()
+
+
+def _after_fork() -> None:
+    # the parent's writer thread does not exist in a forked child, and its queue is the parent's
+    global _writer, _pending, _lock, _flush_lock, _wake
+    _writer, _pending, _lock, _flush_lock, _wake = None, [], threading.Lock(), threading.Lock(), threading.Event()
+
+
+atexit.register(flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+# --- Rolling aggregation --------------------------------------------------
+
+def state_path(log_dir: str = None) -> str:
+    return os.path.join(log_dir or LOG_DIR, "rollup.json")
+
+
+def load_state(log_dir: str = None) -> Dict[str, Any]:
+    try:
+        with open(state_path(log_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"offsets": {}, "days": {}}
+
+
+def _bucket(ms: float) -> int:
+    return math.floor(math.log(ms, BUCKET_BASE)) if ms > 0.01 else -49  # -49 ~ 0.01ms floor
+
+
+def _fold(days: Dict[str, Any], ev: Dict[str, Any]) -> None:
+    stage = ev.get("stage")
+    if not stage:
+        return
+    day = str(ev.get("ts", ""))[:10]
+    roll = days.setdefault(day, {}).setdefault(stage, {
+        "count": 0, "errors": 0, "items": 0, "duration_ms": 0.0,
+        "cache_hit": 0, "cache_miss": 0, "hist": {}})
+    if ev.get("event") == "cache":
+        roll["cache_hit" if ev.get("hit") else "cache_miss"] += 1
+        return
+    ms = float(ev.get("duration_ms") or 0)
+    roll["count"] += 1
+    roll["duration_ms"] += ms
+    roll["items"] += int(ev.get("items") or 0)
+    if ev.get("ok") is False:
+        roll["errors"] += 1
+    b = str(_bucket(ms))
+    roll["hist"][b] = roll["hist"].get(b, 0) + 1
+
+
+def update(log_dir: str = None) -> int:
+    """Fold newly appended events into the daily rollups; returns the number of events read."""
+    log_dir = log_dir or LOG_DIR
+    state = load_state(log_dir)
+    offsets = state["offsets"]
+    read = 0
+    present = set()
+    for path in sorted(glob.glob(os.path.join(log_dir, "events-*.jsonl"))):
+        name = os.path.basename(path)
+        present.add(name)
+        offset = offsets.get(name, 0)
+        if os.path.getsize(path) < offset:
+            offset = 0  # file was replaced; start over
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # leave a partially written last line for the next run
+        for line in data[:end].splitlines():
+            try:
+                _fold(state["days"], json.loads(line))
+                read += 1
+            except ValueError:
+                continue
+        offsets[name] = offset + end
+    state["offsets"] = {k: v for k, v in offsets.items() if k in present}
+    os.makedirs(log_dir, exist_ok=True)
+    tmp = state_path(log_dir) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp, state_path(log_dir))
+    return read
+
+
+def _hist_percentile(hist: Dict[str, int], pct: float) -> float:
+    total = sum(hist.values())
+    if not total:
+        return 0.0
+    rank = math.ceil(pct / 100 * total)
+    seen = 0
+    for b in sorted(hist, key=int):
+        seen += hist[b]
+        if seen >= rank:
+            return round(BUCKET_BASE ** (int(b) + 0.5), 3)  # geometric bucket midpoint
+    return 0.0
+
+
+def query(days: int = 7, stage_prefix: str = "", log_dir: str = None) -> List[Dict[str, Any]]:
+    """Per-stage p50/p95 duration, cache hit rate and throughput over the last `days` days."""
+    state = load_state(log_dir)
+    since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+    merged: Dict[str, Dict[str, Any]] = {}
+    for day, stages in state["days"].items():
+        if day < since:
+            continue
+        for stage, roll in stages.items():
+            if not stage.startswith(stage_prefix):
+                continue
+            m = merged.setdefault(stage, {"count": 0, "errors": 0, "items": 0, "duration_ms": 0.0,
+                                          "cache_hit": 0, "cache_miss": 0, "hist": {}})
+            for key in ("count", "errors", "items", "duration_ms", "cache_hit", "cache_miss"):
+                m[key] += roll[key]
+            for b, n in roll["hist"].items():
+                m["hist"][b] = m["hist"].get(b, 0) + n
+    rows = []
+    for stage, m in sorted(merged.items()):
+        lookups = m["cache_hit"] + m["cache_miss"]
+        secs = m["duration_ms"] / 1000
+        rows.append({
+            "stage": stage,
+            "count": m["count"],
+            "errors": m["errors"],
+            "p50_ms": _hist_percentile(m["hist"], 50),
+            "p95_ms": _hist_percentile(m["hist"], 95),
+            "cache_hit_rate": round(m["cache_hit"] / lookups, 4) if lookups else None,
+            "items": m["items"],
+            "items_per_s": round(m["items"] / secs, 1) if m["items"] and secs else None,
+        })
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Telemetry rollups: update and report per-stage stats")
+    ap.add_argument("--dir", default=LOG_DIR, help=f"events directory (default: {LOG_DIR})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("update", help="fold newly appended events into the daily rollups")
+    rp = sub.add_parser("report", help="per-stage p50/p95, cache hit rate and throughput")
+    rp.add_argument("--days", type=int, default=7)
+    rp.add_argument("--stage", default="", help="only stages starting with this prefix")
+    rp.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    read = update(args.dir)
+    if args.cmd == "update":
+        print(f"folded {read} new events into {state_path(args.dir)}")
+        return 0
+    rows = query(args.days, args.stage, args.dir)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    if not rows:
+        print("no telemetry events in range")
+        return 0
+    print(f"{'stage':32} {'count':>7} {'err':>5} {'p50 ms':>10} {'p95 ms':>10} {'cache hit':>9} {'items/s':>10}")
+    for r in rows:
+        hit = f"{r['cache_hit_rate']:.1%}" if r["cache_hit_rate"] is not None else "-"
+        ips = f"{r['items_per_s']:.1f}" if r["items_per_s"] is not None else "-"
+        print(f"{r['stage']:32} {r['count']:7d} {r['errors']:5d} {r['p50_ms']:10.2f} {r['p95_ms']:10.2f} {hit:>9} {ips:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())